@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 
 import json
+from collections import OrderedDict, defaultdict
 from datetime import date, datetime, time
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Q
 from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpResponse
 from django.contrib.sites.shortcuts import get_current_site
+from django.utils.translation import get_language, ugettext as _
 
-from program.models import Note, Show, Category, TimeSlot, Host, Schedule
+from program.models import Category, TimeSlot, Schedule
+from program.version import get_program_version
 
 
 def generate_frapp_broadcastinfos(schedule):
@@ -53,25 +58,21 @@ def generate_frapp_broadcastinfos(schedule):
     return broadcastinfos
 
 
-def json_frapp(request):
+def get_frapp_output(day, site):
     """
-    Expects GET variable 'date' (date), otherwise date will be today
-
-    Returns 3 JSON objects:
-        - categories: A list of all existing categories
-        - series: A list of shows for the given date
-        - shows: A list of timeslots for the given date including notes
+    Returns categories, series and shows of the given day according to the FRAPP datamodel
+    Takes a fixed number of queries regardless of the number of timeslots
     """
     from pv.settings import MEDIA_URL
 
-    if request.GET.get('date') == None:
-        start = datetime.combine(date.today(), time(0, 0))
-    else:
-        start = datetime.combine( datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date(), time(0, 0))
-
+    start = datetime.combine(day, time(0, 0))
     end = datetime.combine(start, time(23, 59))
 
-    timeslots = TimeSlot.objects.filter(start__gte=start,start__lte=end).select_related('show').order_by('start')
+    # Timeslots including notes, hosts and categories of their shows
+    timeslots = list(TimeSlot.objects.filter(start__gte=start,start__lte=end)
+                                     .select_related('show', 'schedule', 'note')
+                                     .prefetch_related('show__hosts', 'show__category')
+                                     .order_by('start'))
 
 
     '''Generate categories object for output'''
@@ -89,57 +90,60 @@ def json_frapp(request):
 
         categories_output.append(c_entry)
 
-    # Get all series for timeslots
-    series = set()
+    # Get all series for timeslots in order of their first timeslot
+    series = OrderedDict()
     for ts in timeslots:
-        series.add(ts.show)
+        series.setdefault(ts.show_id, ts.show)
+
+    # Get active schedules for the given date
+    # But include upcoming single timeslots (with rrule_id=1)
+    schedules = defaultdict(list)
+    schedules_repetition = defaultdict(list)
+
+    for schedule in Schedule.objects.filter( Q(show__in=series.keys()) &
+                                             (
+                                               Q(rrule_id__gt=1,dstart__lte=start,until__gte=start) |
+                                               Q(rrule_id=1,dstart__gte=start)
+                                             )
+                                           ):
+        if schedule.is_repetition:
+            schedules_repetition[schedule.show_id].append(schedule)
+        else:
+            schedules[schedule.show_id].append(schedule)
 
 
     '''Generate series object for output'''
 
     series_output = []
 
-    for s in series:
+    for s in series.values():
+        hosts = s.hosts.all()
+        categories = s.category.all()
+
         metainfos = []
-        metainfos.append({ 'key': 'ProduzentIn', 'value': ', '.join(ts.show.hosts.values_list('name', flat=True)) })
-        metainfos.append({ 'key': 'E-Mail', 'value': ', '.join(ts.show.hosts.values_list('email', flat=True)) })
+        metainfos.append({ 'key': 'ProduzentIn', 'value': ', '.join(h.name for h in hosts) })
+        metainfos.append({ 'key': 'E-Mail', 'value': ', '.join(h.email for h in hosts) })
 
-        image = '' if s.image.name == None or s.image.name == '' else str(get_current_site(request)) + MEDIA_URL + s.image.name
+        image = '' if s.image.name == None or s.image.name == '' else site + MEDIA_URL + s.image.name
         url = '' if s.website == None or s.website == '' else s.website
 
-        # Get active schedules for the given date
-        # But include upcoming single timeslots (with rrule_id=1)
-        schedules = Schedule.objects.filter( Q(show=s.id,is_repetition=False) &
-                                             (
-                                               Q(rrule_id__gt=1,dstart__lte=start,until__gte=start) |
-                                               Q(rrule_id=1,dstart__gte=start)
-                                             )
-                                           )
-
-        schedules_repetition = Schedule.objects.filter( Q(show=s.id,is_repetition=True) &
-                                             (
-                                               Q(rrule_id__gt=1,dstart__lte=start,until__gte=start) |
-                                               Q(rrule_id=1,dstart__gte=start)
-                                             )
-                                           )
-
         broadcastinfos = ''
 
-        if not schedules.exists():
+        if not schedules[s.id]:
             continue
 
-        for schedule in schedules:
+        for schedule in schedules[s.id]:
             broadcastinfos = broadcastinfos + generate_frapp_broadcastinfos(schedule)
 
-        if schedules_repetition.exists():
+        if schedules_repetition[s.id]:
             broadcastinfos = broadcastinfos + 'Wiederholung jeweils:'
-            for schedule in schedules_repetition:
+            for schedule in schedules_repetition[s.id]:
                 broadcastinfos = broadcastinfos + generate_frapp_broadcastinfos(schedule)
 
         s_entry = {
             'id': s.id,
-            'categoryid': s.category.values_list('id', flat=True)[0],
-            'color': s.category.values_list('color', flat=True)[0].replace('#', '').upper(),
+            'categoryid': categories[0].id if categories else None,
+            'color': categories[0].color.replace('#', '').upper() if categories else '',
             'namedisplay': s.name,
             'description': s.description,
             'url': url,
@@ -160,15 +164,15 @@ def json_frapp(request):
         is_repetition = ' ' + _('REP') if ts.schedule.is_repetition is 1 else ''
         namedisplay = ts.show.name + is_repetition
         description = ts.show.description
-        url = str(get_current_site(request)) + '/shows/' + ts.show.slug
+        url = site + '/shows/' + ts.show.slug
         urlmp3 = ''
 
         # If there's a note to the timeslot use its title, description and url
         try:
-            note = Note.objects.get(timeslot=ts.id)
+            note = ts.note
             namedisplay = note.title + is_repetition
             description = note.content
-            url = str(get_current_site(request)) + '/notes/' + note.slug
+            url = site + '/notes/' + note.slug
             urlmp3 = note.audio_url
         except ObjectDoesNotExist:
             pass
@@ -191,5 +195,32 @@ def json_frapp(request):
     output['series'] = series_output
     output['shows'] = shows_output
 
-    return HttpResponse(json.dumps(output, ensure_ascii=False).encode('utf8'),
-                        content_type="application/json; charset=utf-8")
+    return output
+
+
+def json_frapp(request):
+    """
+    Expects GET variable 'date' (date), otherwise date will be today
+
+    Returns 3 JSON objects:
+        - categories: A list of all existing categories
+        - series: A list of shows for the given date
+        - shows: A list of timeslots for the given date including notes
+
+    The output of each day is cached until the program changes
+    """
+
+    if request.GET.get('date') == None:
+        day = date.today()
+    else:
+        day = datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date()
+
+    site = str(get_current_site(request))
+    key = 'frapp:%s:%s:%s:%s' % (get_program_version(), site, get_language(), day.isoformat())
+    content = cache.get(key)
+
+    if content is None:
+        content = json.dumps(get_frapp_output(day, site), ensure_ascii=False).encode('utf8')
+        cache.set(key, content, getattr(settings, 'FRAPP_CACHE_TIMEOUT', 60 * 60 * 24))
+
+    return HttpResponse(content, content_type="application/json; charset=utf-8")
@@ -0,0 +1,164 @@
+"""
+Server-sent events of show and track changes
+
+A single producer thread per process publishes the show on air and the latest play of the
+active automation. The show is taken from the in-memory timeline and the producer wakes up at
+the end of the current entry, so show changes are pushed at the boundary without querying the
+database. Plays are taken from the now-playing buffer, which hits the automation's database at
+most every NOP_REFRESH_INTERVAL seconds. Listeners only wait for the producer, so any number of
+them costs the same single poll. The producer runs while there are listeners.
+
+Each open stream still occupies a worker (thread or process) of the WSGI server for as long as
+the client stays connected, so the number of workers limits the number of listeners.
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from program.timeline import get_timeline
+
+from .nowplaying import now_playing
+
+
+EVENT_NAMES = ('show', 'track')
+
+logger = logging.getLogger(__name__)
+
+
+def _dtstring(dt):
+    return dt.strftime('%Y-%m-%d %H:%M')
+
+
+class EventStream(object):
+    def __init__(self, interval=None):
+        self.interval = interval if interval != None else getattr(settings, 'NOP_REFRESH_INTERVAL', 5)
+        self.events = {}
+        self.sequence = 0
+        self.listeners = 0
+        self.thread = None
+        self.condition = threading.Condition()
+
+    def subscribe(self):
+        """Registers a listener, starting the producer if it isn't running"""
+
+        with self.condition:
+            self.listeners += 1
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='nop-events', daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self):
+        with self.condition:
+            self.listeners -= 1
+
+    def publish(self, name, data):
+        """Stores the data of an event and wakes up the listeners if it changed"""
+
+        with self.condition:
+            if name not in self.events or self.events[name] != data:
+                self.events[name] = data
+                self.sequence += 1
+                self.condition.notify_all()
+
+    def wait(self, sequence, timeout):
+        """Waits until events newer than the given sequence are published, returns the sequence and all events"""
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence != sequence, timeout)
+            return self.sequence, dict(self.events)
+
+    def get_show(self):
+        """Returns the show on air and the seconds until it ends"""
+
+        entry = get_timeline().current()
+
+        if entry is None:
+            return {'start': None, 'id': None, 'name': None, 'note': None}, self.interval
+
+        show = {'start': _dtstring(entry.start),
+                'id': entry.show_id,
+                'name': entry.show_name,
+                'note': entry.note_id}
+
+        return show, (entry.end - datetime.now()).total_seconds()
+
+    def get_track(self):
+        entry = now_playing.current()
+
+        if entry is None:
+            return None
+
+        return {'start': _dtstring(datetime.fromtimestamp(entry.timestamp // 1000000)),
+                'artist': entry.artist,
+                'title': entry.title,
+                'album': entry.album}
+
+    def run(self):
+        try:
+            while True:
+                with self.condition:
+                    if self.listeners <= 0:
+                        self.thread = None
+                        return
+
+                timeout = self.interval
+
+                try:
+                    show, remaining = self.get_show()
+                    self.publish('show', show)
+                    self.publish('track', self.get_track())
+                    timeout = min(timeout, remaining)
+                except Exception:
+                    # Try again after the interval, listeners keep the last events
+                    logger.exception('Could not publish nop events')
+                finally:
+                    close_old_connections()
+
+                # Wake up right after the current show ends
+                time.sleep(max(timeout, 0) + 0.01)
+        finally:
+            # Let the next listener start a new producer if this one died
+            with self.condition:
+                if self.thread is threading.current_thread():
+                    self.thread = None
+
+    def stream(self, keepalive=None):
+        """
+        Yields server-sent events of the current show and track and of their changes
+        Sends a comment every 'keepalive' seconds without changes so closed connections are noticed
+        """
+
+        keepalive = keepalive or getattr(settings, 'NOP_EVENTS_KEEPALIVE', 15)
+        sent = {}
+        # Nothing is published at sequence 0, so the first wait returns as soon as there are events
+        sequence = 0
+
+        self.subscribe()
+
+        try:
+            yield 'retry: %d\n\n' % (self.interval * 1000)
+
+            while True:
+                sequence, events = self.wait(sequence, keepalive)
+                changed = False
+
+                for name in EVENT_NAMES:
+                    if name in events and (name not in sent or events[name] != sent[name]):
+                        sent[name] = events[name]
+                        changed = True
+                        yield 'event: %s\ndata: %s\n\n' % (name, json.dumps(events[name]))
+
+                if not changed:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe()
+
+
+event_stream = EventStream()
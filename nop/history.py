@@ -0,0 +1,166 @@
+"""
+Historical lookups of the automation's log
+
+The state table only logs transitions between master and standby, so it is kept in memory as
+sorted lists of timestamps and states, fetching only newer transitions at most every
+NOP_REFRESH_INTERVAL seconds. Which automation was on air at a timestamp is then found by binary
+search. Plays of a time range are read from master and standby in chunks, merged by time, assigned
+by the state at their timestamp and merged with the timeslots on air.
+"""
+
+import csv
+import heapq
+import io
+import itertools
+import json
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from operator import itemgetter
+from time import monotonic
+
+from django.conf import settings
+
+from program.models import TimeSlot
+from program.utils import to_naive
+
+from .models import Master, Standby, State
+
+
+DB = 'nop'
+
+PLAY_FIELDS = ('start', 'show', 'artist', 'title', 'album')
+
+# Number of log entries fetched at a time
+CHUNK_SIZE = 2000
+
+
+def to_timestamp(dt):
+    """Returns the timestamp of the automation's log (microseconds since epoch) of a naive local datetime"""
+    return int(time.mktime(dt.timetuple())) * 1000000
+
+
+class StateHistory(object):
+    def __init__(self, interval=None):
+        self.interval = interval if interval != None else getattr(settings, 'NOP_REFRESH_INTERVAL', 5)
+        self.timestamps = []
+        self.states = []
+        self.refreshed = None
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Appends transitions newer than the known ones"""
+
+        with self.lock:
+            if self.refreshed != None and monotonic() - self.refreshed < self.interval:
+                return
+
+            transitions = State.objects.using(DB).order_by('timestamp')
+
+            if self.timestamps:
+                transitions = transitions.filter(timestamp__gt=self.timestamps[-1])
+
+            timestamps, states = list(self.timestamps), list(self.states)
+
+            for timestamp, state in transitions.values_list('timestamp', 'state'):
+                timestamps.append(timestamp)
+                states.append(state)
+
+            # Readers never see lists of different lengths
+            self.timestamps, self.states = timestamps, states
+            self.refreshed = monotonic()
+
+    def which(self, timestamp):
+        """Returns the model of the automation on air right before the given timestamp, Master if unknown"""
+
+        if self.refreshed is None or monotonic() - self.refreshed >= self.interval:
+            self.refresh()
+
+        timestamps, states = self.timestamps, self.states
+        i = bisect_left(timestamps, timestamp) - 1
+
+        if i < 0 or states[i] == 'master':
+            return Master
+
+        return Standby
+
+
+state_history = StateHistory()
+
+
+def iter_log(model, log, first, last):
+    """
+    Yields (timestamp, artist, title, album, log) of the pool entries of a log within [first, last)
+    Fetches CHUNK_SIZE rows at a time after the last timestamp seen, since database drivers like
+    MySQL's buffer whole result sets on the client
+    """
+
+    after = first - 1
+
+    while True:
+        chunk = list(model.objects.using(DB).filter(carttype__exact='pool', timestamp__gt=after, timestamp__lt=last)
+                                            .order_by('timestamp')
+                                            .values_list('timestamp', 'artist', 'title', 'album')[:CHUNK_SIZE])
+
+        for entry in chunk:
+            yield entry + (log,)
+
+        if len(chunk) < CHUNK_SIZE:
+            return
+
+        after = chunk[-1][0]
+
+
+def iter_plays(start, end):
+    """
+    Yields the pool entries played on air within [start, end) ordered by time, with their shows
+    Reads both logs in chunks and merges them with the timeslots on air as they are read, so memory
+    doesn't grow with the length of the range
+    """
+
+    first, last = to_timestamp(start), to_timestamp(end)
+
+    entries = heapq.merge(iter_log(Master, 'master', first, last), iter_log(Standby, 'standby', first, last), key=itemgetter(0))
+    timeslots = TimeSlot.objects.get_overlapping_timeslots(start, end).order_by('start').values_list('start', 'end', 'show__name').iterator()
+    timeslot = next(timeslots, None)
+
+    for timestamp, artist, title, album, log in entries:
+        # Only plays of the automation on air at that time
+        if state_history.which(timestamp) is not (Master if log == 'master' else Standby):
+            continue
+
+        played = datetime.fromtimestamp(timestamp // 1000000)
+
+        while timeslot != None and to_naive(timeslot[1]) <= played:
+            timeslot = next(timeslots, None)
+
+        show = timeslot[2] if timeslot != None and to_naive(timeslot[0]) <= played else None
+
+        yield {'show': show,
+               'start': played.strftime('%Y-%m-%d %H:%M'),
+               'artist': artist,
+               'title': title,
+               'album': album}
+
+
+def get_plays(start, end):
+    """Returns the pool entries played on air within [start, end) ordered by time, with their shows"""
+    return list(iter_plays(start, end))
+
+
+def write_plays(plays, fmt='csv'):
+    """Yields plays as lines of CSV or JSON objects"""
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        for row in itertools.chain([PLAY_FIELDS], ([play[field] for field in PLAY_FIELDS] for play in plays)):
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        for play in plays:
+            yield json.dumps(play) + '\n'
@@ -0,0 +1,35 @@
+import sys
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nop.history import iter_plays, write_plays
+
+
+class Command(BaseCommand):
+    help = 'exports all pool entries played between two points in time with their shows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='Start as YYYY-MM-DDTHH:MM')
+        parser.add_argument('end', help='End as YYYY-MM-DDTHH:MM')
+        parser.add_argument('--format', dest='format', choices=('csv', 'jsonl'), default='csv', help='Output format, one play per line')
+        parser.add_argument('--output', dest='output', help='File to write to instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options['start'], '%Y-%m-%dT%H:%M')
+            end = datetime.strptime(options['end'], '%Y-%m-%dT%H:%M')
+        except ValueError:
+            raise CommandError('start and end must be given as YYYY-MM-DDTHH:MM')
+
+        if end <= start:
+            raise CommandError('end must be after start')
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+
+        try:
+            for line in write_plays(iter_plays(start, end), options['format']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
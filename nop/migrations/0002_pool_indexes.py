@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 10:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='master',
+            index=models.Index(fields=['carttype', 'timestamp'], name='master_carttyp_782c08_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='standby',
+            index=models.Index(fields=['carttype', 'timestamp'], name='standby_carttyp_ebd28f_idx'),
+        ),
+    ]
@@ -9,6 +9,9 @@ class CartTypeField(models.Field):
         super(CartTypeField, self).__init__(*args, **kwargs)
 
     def db_type(self, connection):
+        # Other databases, e.g. SQLite of tests, don't know ENUM
+        if connection.vendor != 'mysql':
+            return 'varchar({})'.format(self.max_length)
         return "ENUM({})".format(','.join("'{}'".format(col)
                                           for col, _ in self.types))
 
@@ -25,6 +28,9 @@ class Master(models.Model):
     class Meta:
         db_table = 'master'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['carttype', 'timestamp']),
+        ]
 
 
 class Standby(models.Model):
@@ -40,6 +46,9 @@ class Standby(models.Model):
     class Meta:
         db_table = 'standby'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['carttype', 'timestamp']),
+        ]
 
 
 class State(models.Model):
@@ -0,0 +1,89 @@
+"""
+Now-playing buffer of the automation
+
+Keeps the last NOP_BUFFER_SIZE pool entries of master and standby and the current state in
+memory. The buffer is refreshed at most every NOP_REFRESH_INTERVAL seconds and only fetches
+entries newer than the ones it has. A single request refreshes it while concurrent requests
+are answered from the previous snapshot, so the database load doesn't grow with the number of
+listeners polling the current title.
+"""
+
+import threading
+from collections import deque, namedtuple
+from time import monotonic
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import Master, Standby, State
+
+
+DB = 'nop'
+
+PoolEntry = namedtuple('PoolEntry', ('timestamp', 'artist', 'title', 'album'))
+
+# Immutable state of the buffer: the state ('master' or 'standby') and the newest entries first
+Snapshot = namedtuple('Snapshot', ('state', 'master', 'standby'))
+
+
+class NowPlaying(object):
+    def __init__(self, size=None, interval=None):
+        self.size = size or getattr(settings, 'NOP_BUFFER_SIZE', 50)
+        self.interval = interval if interval != None else getattr(settings, 'NOP_REFRESH_INTERVAL', 5)
+        self.buffers = {'master': deque(maxlen=self.size), 'standby': deque(maxlen=self.size)}
+        self.snapshot = None
+        self.refreshed = None
+        self.lock = threading.Lock()
+
+    def is_stale(self):
+        return self.refreshed is None or monotonic() - self.refreshed >= self.interval
+
+    def get(self):
+        """Returns the current snapshot, refreshing it first if it's older than the interval"""
+
+        if self.is_stale():
+            # Single flight: one request refreshes, the others keep using the previous snapshot
+            if self.lock.acquire(blocking=self.snapshot is None):
+                try:
+                    if self.is_stale():
+                        self.refresh()
+                finally:
+                    self.lock.release()
+
+        return self.snapshot
+
+    def refresh(self):
+        """Fetches the current state and pool entries newer than the buffered ones"""
+
+        try:
+            state = State.objects.using(DB).values_list('state', flat=True).first()
+
+            for name, model in (('master', Master), ('standby', Standby)):
+                buffer = self.buffers[name]
+                entries = model.objects.using(DB).filter(carttype__exact='pool')
+
+                if buffer:
+                    entries = entries.filter(timestamp__gt=buffer[0].timestamp)
+
+                # Entries come newest first
+                for entry in reversed(entries.values_list('timestamp', 'artist', 'title', 'album')[:self.size]):
+                    buffer.appendleft(PoolEntry(*entry))
+        except DatabaseError:
+            # Keep answering from the last snapshot, if any, until the next interval
+            if self.snapshot is None:
+                raise
+        else:
+            self.snapshot = Snapshot(state, tuple(self.buffers['master']), tuple(self.buffers['standby']))
+
+        self.refreshed = monotonic()
+
+    def current(self):
+        """Returns the latest pool entry of the active automation or None"""
+
+        snapshot = self.get()
+        entries = snapshot.standby if snapshot.state and snapshot.state != 'master' else snapshot.master
+
+        return entries[0] if entries else None
+
+
+now_playing = NowPlaying()
@@ -0,0 +1,224 @@
+import json
+import threading
+from datetime import date, datetime, time
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from nop import history
+from nop.events import EventStream
+from nop.history import StateHistory, get_plays, to_timestamp, write_plays
+from nop.models import Master, Standby, State
+from nop.nowplaying import NowPlaying, PoolEntry
+from program.models import RRule, Schedule, Show, TimeSlot
+
+
+class NopTestCase(TestCase):
+    multi_db = True
+
+    def create_entry(self, model, timestamp, title, carttype='pool'):
+        return model.objects.using('nop').create(timestamp=timestamp, cart=1, len=180, showtitle='', title=title,
+                                                 artist='Artist', album='Album', carttype=carttype)
+
+    def create_state(self, timestamp, state):
+        return State.objects.using('nop').create(timestamp=timestamp, state=state)
+
+
+class NowPlayingTest(NopTestCase):
+    def setUp(self):
+        for i in range(1, 5):
+            self.create_entry(Master, i * 1000000, 'Master %d' % i)
+
+        self.create_entry(Master, 5 * 1000000, 'Jingle', carttype='jingle')
+        self.create_entry(Standby, 3500000, 'Standby')
+
+    def test_current(self):
+        buffer = NowPlaying(size=3, interval=0)
+        self.assertEqual(buffer.current().title, 'Master 4')
+
+        self.create_state(6000000, 'standby')
+        self.assertEqual(buffer.current().title, 'Standby')
+
+    def test_buffer_size(self):
+        buffer = NowPlaying(size=3, interval=0)
+        snapshot = buffer.get()
+
+        self.assertEqual([entry.title for entry in snapshot.master], ['Master 4', 'Master 3', 'Master 2'])
+        self.assertEqual(snapshot.standby, (PoolEntry(3500000, 'Artist', 'Standby', 'Album'),))
+
+    def test_incremental_refresh(self):
+        buffer = NowPlaying(size=3, interval=0)
+        buffer.get()
+
+        self.create_entry(Master, 7000000, 'Master 7')
+
+        # Only the state and the entries newer than the buffered ones of each log are fetched
+        with self.assertNumQueries(3, using='nop'):
+            snapshot = buffer.get()
+
+        self.assertEqual([entry.title for entry in snapshot.master], ['Master 7', 'Master 4', 'Master 3'])
+
+    def test_interval(self):
+        buffer = NowPlaying(size=3, interval=60)
+        buffer.get()
+
+        self.create_entry(Master, 7000000, 'Master 7')
+
+        with self.assertNumQueries(0, using='nop'):
+            self.assertEqual(buffer.current().title, 'Master 4')
+
+    def test_database_error(self):
+        buffer = NowPlaying(size=3, interval=0)
+        snapshot = buffer.get()
+
+        with mock.patch.object(State.objects, 'using', side_effect=DatabaseError):
+            self.assertIs(buffer.get(), snapshot)
+
+        with mock.patch.object(State.objects, 'using', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                NowPlaying(size=3, interval=0).get()
+
+
+
+class HistoryTest(NopTestCase):
+    fixtures = ['rrules', 'types', 'rtrcategories', 'categories', 'topics', 'musicfocus', 'languages', 'hosts', 'shows']
+
+    def setUp(self):
+        self.show = Show.objects.get(pk=1)
+        schedule = Schedule.objects.create(rrule=RRule.objects.get(pk=1), byweekday=3, show=self.show, dstart=date(2026, 11, 5),
+                                           tstart=time(10, 0), tend=time(11, 0), until=date(2026, 11, 5))
+        TimeSlot(schedule=schedule, start=timezone.make_aware(datetime(2026, 11, 5, 10, 0)),
+                 end=timezone.make_aware(datetime(2026, 11, 5, 11, 0))).save()
+
+        # Standby is on air from 10:30 to 10:45
+        self.create_state(self.timestamp(10, 30), 'standby')
+        self.create_state(self.timestamp(10, 45), 'master')
+
+        self.create_entry(Master, self.timestamp(9, 50), 'Before')
+        self.create_entry(Master, self.timestamp(10, 10), 'Master')
+        self.create_entry(Master, self.timestamp(10, 20), 'Jingle', carttype='jingle')
+        self.create_entry(Master, self.timestamp(10, 40), 'Master off air')
+        self.create_entry(Master, self.timestamp(10, 50), 'Master again')
+        self.create_entry(Standby, self.timestamp(10, 5), 'Standby off air')
+        self.create_entry(Standby, self.timestamp(10, 35), 'Standby')
+
+        patcher = mock.patch.object(history, 'state_history', StateHistory(interval=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def timestamp(self, hour, minute):
+        return to_timestamp(datetime(2026, 11, 5, hour, minute))
+
+    def test_which(self):
+        states = StateHistory(interval=0)
+
+        self.assertIs(states.which(self.timestamp(10, 0)), Master)
+        self.assertIs(states.which(self.timestamp(10, 30)), Master)
+        self.assertIs(states.which(self.timestamp(10, 31)), Standby)
+        self.assertIs(states.which(self.timestamp(10, 50)), Master)
+
+        self.create_state(self.timestamp(11, 0), 'standby')
+        self.assertIs(states.which(self.timestamp(11, 10)), Standby)
+
+    def test_plays(self):
+        plays = get_plays(datetime(2026, 11, 5, 9, 0), datetime(2026, 11, 5, 11, 30))
+
+        self.assertEqual([(play['start'], play['show'], play['title']) for play in plays],
+                         [('2026-11-05 09:50', None, 'Before'),
+                          ('2026-11-05 10:10', self.show.name, 'Master'),
+                          ('2026-11-05 10:35', self.show.name, 'Standby'),
+                          ('2026-11-05 10:50', self.show.name, 'Master again')])
+
+    def test_chunks(self):
+        plays = get_plays(datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 10, 50))
+
+        with mock.patch.object(history, 'CHUNK_SIZE', 1):
+            self.assertEqual(get_plays(datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 10, 50)), plays)
+
+        self.assertEqual([play['title'] for play in plays], ['Master', 'Standby'])
+
+    def test_write_plays(self):
+        plays = get_plays(datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 10, 30))
+        lines = list(write_plays(plays))
+
+        self.assertEqual(lines, ['start,show,artist,title,album\r\n',
+                                 '2026-11-05 10:10,%s,Artist,Master,Album\r\n' % self.show.name])
+
+
+class ProducerCrash(BaseException):
+    pass
+
+
+class EventStreamTest(SimpleTestCase):
+    def setUp(self):
+        self.stream = EventStream(interval=0.01)
+        self.show = {'start': '2026-11-05 10:00', 'id': 1, 'name': 'Show', 'note': None}
+
+        for name, value in (('get_show', (self.show, 60)), ('get_track', {'title': 'A'})):
+            patcher = mock.patch.object(self.stream, name, return_value=value)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def test_publish(self):
+        self.stream.publish('track', {'title': 'A'})
+        sequence, events = self.stream.wait(0, 0)
+
+        # Unchanged data wakes up nobody
+        self.stream.publish('track', {'title': 'A'})
+        self.assertEqual(self.stream.wait(sequence, 0), (sequence, events))
+
+        self.stream.publish('track', {'title': 'B'})
+        self.assertEqual(self.stream.wait(sequence, 0), (sequence + 1, {'track': {'title': 'B'}}))
+
+    def test_stream(self):
+        events = self.stream.stream(keepalive=0.05)
+
+        self.assertEqual(next(events), 'retry: 10\n\n')
+        self.assertEqual(next(events), 'event: show\ndata: %s\n\n' % json.dumps(self.show))
+        self.assertEqual(next(events), 'event: track\ndata: {"title": "A"}\n\n')
+
+        self.get_track.return_value = {'title': 'B'}
+        self.assertEqual(next(events), 'event: track\ndata: {"title": "B"}\n\n')
+        self.assertEqual(next(events), ': keepalive\n\n')
+
+        thread = self.stream.thread
+        events.close()
+        thread.join(1)
+
+        # The producer stops without listeners
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.stream.thread)
+
+    def test_restart(self):
+        self.stream.listeners = 1
+        self.stream.thread = threading.current_thread()
+        self.get_show.side_effect = ProducerCrash
+
+        with self.assertRaises(ProducerCrash):
+            self.stream.run()
+
+        self.assertIsNone(self.stream.thread)
+
+        # The next listener starts a new producer
+        self.get_show.side_effect = None
+        self.stream.subscribe()
+        thread = self.stream.thread
+
+        self.assertEqual(self.stream.wait(0, 1)[1]['show'], self.show)
+
+        self.stream.listeners = 0
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+    def test_errors(self):
+        self.get_show.side_effect = ValueError
+        self.stream.listeners = 1
+
+        with mock.patch('nop.events.time.sleep', side_effect=ProducerCrash), self.assertLogs('nop.events', 'ERROR'):
+            with self.assertRaises(ProducerCrash):
+                self.stream.run()
+
+        # Failures of a single poll don't stop the producer
+        self.assertEqual(self.get_show.call_count, 1)
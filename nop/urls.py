@@ -1,14 +1,20 @@
+from django.conf import settings
 from django.conf.urls import url
 from django.views.static import serve
 
-from .views import get, get_current, nop_form
+from program.caching import cache_until_boundary
+
+from .views import events, export, get, get_current, get_range, nop_form
 
 import os
 
 NOP_SITE_MEDIA = os.path.join(os.path.dirname(__file__), 'site_media')
 
 urlpatterns = [
-    url(r'^get_current/?$', get_current),
+    url(r'^get_current/?$', cache_until_boundary(getattr(settings, 'NOP_REFRESH_INTERVAL', 5))(get_current)),
+    url(r'^range/?$', get_range),
+    url(r'^export/?$', export),
+    url(r'^events/?$', events),
     url(r'^(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<hour>\d{1,2})/(?P<minute>\d{1,2})/?$', get),
     url(r'^$', nop_form),
     url(r'^static/(?P<path>.*)$', serve, {'document_root': NOP_SITE_MEDIA}),
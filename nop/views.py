@@ -3,17 +3,26 @@
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.shortcuts import render_to_response
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django import forms
 from .models import Master, Standby, State
+from .events import event_stream
+from .history import get_plays, iter_plays, state_history, write_plays
+from .nowplaying import now_playing
 from program.models import TimeSlot
+from program.timeline import get_timeline
 
 import json
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 
 DB = 'nop'
 
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
 class NopForm(forms.Form):
     date = forms.DateField(
         required=True,
@@ -33,9 +42,9 @@ def _dtstring(dt):
 
 def _which(timestamp=None):
     if timestamp:
-        res = State.objects.using(DB).filter(timestamp__lt=timestamp)[0]
-    else:
-        res = State.objects.using(DB).all()[0]
+        return state_history.which(timestamp)
+
+    res = State.objects.using(DB).all()[0]
     if not res or res.state == 'master':
         return Master
     else:
@@ -43,12 +52,21 @@ def _which(timestamp=None):
 
 
 def _get_show(datetime=None):
+    if not datetime:
+        entry = get_timeline().current()
+
+        if entry is None:
+            return {'start': None, 'id': None, 'name': None}
+
+        return {'start': _dtstring(entry.start.timetuple()),
+                'id': entry.show_id,
+                'name': entry.show_name,
+                'note': entry.note_id}
+
     try:
-        if datetime:
-            timeslot = TimeSlot.objects.get(start__lte=datetime,
-                                            end__gt=datetime)
-        else:
-            timeslot = TimeSlot.objects.get_or_create_current()
+        timeslot = TimeSlot.objects.get_window_timeslots(datetime, datetime) \
+                                   .select_related('show', 'note') \
+                                   .get(start__lte=datetime, end__gt=datetime)
     except (ObjectDoesNotExist, MultipleObjectsReturned):
         return {'start': None, 'id': None, 'name': None}
     else:
@@ -71,10 +89,12 @@ def _current():
 
     if show['id'] in settings.MUSIKPROG_IDS \
             or (show['id'] in settings.SPECIAL_PROGRAM_IDS and not show['note']):
-        result = _which().objects.using(DB).filter(carttype__exact='pool')[0]
-        artist = result.artist
-        title = result.title
-        album = result.album
+        result = now_playing.current()
+
+        if result != None:
+            artist = result.artist
+            title = result.title
+            album = result.album
 
     return {'show': show['name'],
             'start': show['start'],
@@ -109,10 +129,74 @@ def get_current(request):
 
 
 def get(request, year=None, month=None, day=None, hour=None, minute=None):
-    response = json.dumps(_bydate(year, month, day, hour, minute))
+    response = json.dumps(_bydate(int(year), int(month), int(day), int(hour), int(minute)))
     return HttpResponse(response, content_type='application/json')
 
 
+def _get_range(request):
+    """Returns the datetimes of GET variables 'start' and 'end', raises ValueError if they are missing or invalid"""
+
+    start = datetime.strptime(request.GET.get('start', ''), '%Y-%m-%dT%H:%M')
+    end = datetime.strptime(request.GET.get('end', ''), '%Y-%m-%dT%H:%M')
+
+    if end <= start:
+        raise ValueError('end before start')
+
+    return start, end
+
+
+def get_range(request):
+    """
+    Returns the pool entries played within a time range with their shows
+    Expects GET variables 'start' and 'end', e.g. ?start=2018-01-01T06:00&end=2018-01-01T12:00
+    """
+
+    try:
+        start, end = _get_range(request)
+    except ValueError:
+        return JsonResponse({'detail': "GET variables 'start' and 'end' must be given as YYYY-MM-DDTHH:MM."}, status=400)
+
+    if end - start > timedelta(days=getattr(settings, 'NOP_RANGE_MAX_DAYS', 7)):
+        return JsonResponse({'detail': 'Invalid time range.'}, status=400)
+
+    response = json.dumps(get_plays(start, end))
+    return HttpResponse(response, content_type='application/json')
+
+
+def export(request):
+    """
+    Streams all pool entries played within a time range of any length with their shows
+    Expects GET variables 'start' and 'end' like /nop/range and 'format' (csv or jsonl), one play per line
+    """
+
+    try:
+        start, end = _get_range(request)
+    except ValueError:
+        return JsonResponse({'detail': "GET variables 'start' and 'end' must be given as YYYY-MM-DDTHH:MM."}, status=400)
+
+    fmt = request.GET.get('format', 'csv')
+
+    if fmt not in EXPORT_CONTENT_TYPES:
+        return JsonResponse({'detail': "GET variable 'format' must be csv or jsonl."}, status=400)
+
+    response = StreamingHttpResponse(write_plays(iter_plays(start, end), fmt), content_type=EXPORT_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = 'attachment; filename="plays-%s-%s.%s"' % (start.strftime('%Y%m%d%H%M'), end.strftime('%Y%m%d%H%M'), fmt)
+    return response
+
+
+def events(request):
+    """
+    Streams server-sent events 'show' and 'track' with the current show and track and whenever they change
+    The data of 'show' is like the show of /nop/get_current, the data of 'track' has start, artist, title and album
+    """
+
+    response = StreamingHttpResponse(event_stream.stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Don't let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def nop_form(request):
     context = {}
     date = None
@@ -1,11 +1,13 @@
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib import admin
+from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 from django.shortcuts import render
 from django.conf import settings
 
+from . import cba
 from .models import Language, Type, MusicFocus, Category, Topic, RTRCategory, Host, Note, RRule, Schedule, Show, TimeSlot
-from .forms import MusicFocusForm
+from .forms import MusicFocusForm, automation_id_formfield
 
 from datetime import date, datetime, time, timedelta
 
@@ -27,15 +29,15 @@ class ActivityFilter(admin.SimpleListFilter):
 
         if self.parameter_name == 'has_schedules_timeslots':  # active/inactive Shows
             if self.value() == 'yes':
-                return queryset.filter(schedules__until__gt=datetime.now()).distinct()
+                return queryset.filter(active_until__gt=date.today())
             if self.value() == 'no':
-                return queryset.filter(schedules__until__lt=datetime.now()).distinct()
+                return queryset.filter(Q(active_until__lte=date.today()) | Q(active_until=None))
 
         if self.parameter_name == 'has_shows_schedules_timeslots':  # active/inactive Hosts
             if self.value() == 'yes':
-                return queryset.filter(shows__schedules__until__gt=datetime.now()).distinct()
+                return queryset.filter(active_until__gt=date.today())
             if self.value() == 'no':
-                return queryset.filter(shows__schedules__until__lt=datetime.now()).distinct()
+                return queryset.filter(Q(active_until__lte=date.today()) | Q(active_until=None))
 
 
 class ActiveSchedulesFilter(ActivityFilter):
@@ -168,11 +170,15 @@ class NoteAdmin(admin.ModelAdmin):
         if not change:
             obj.user = request.user
 
-        # Try to get direct audio URL from CBA
-        obj.audio_url = Note.get_audio_url(obj.cba_id)
+        # Drop the audio URL of a previously linked post
+        if 'cba_id' in form.changed_data:
+            obj.audio_url = ''
 
         obj.save()
 
+        # Get direct audio URL from CBA without waiting for it
+        cba.resolve_note(obj)
+
 
 class TimeSlotInline(admin.TabularInline):
     model = TimeSlot
@@ -195,7 +201,11 @@ class ScheduleAdmin(admin.ModelAdmin):
     def renew(self, request, queryset):
         next_year = date.today().year + 1
         until = date(next_year, 12, 31)
+        show_ids = set(queryset.values_list('show_id', flat=True))
         renewed = queryset.update(until=until)
+
+        # Updates don't send signals
+        Show.update_active_until(show_ids)
         if renewed == 1:
             message = _("1 schedule was renewed until %s") % until
         else:
@@ -208,11 +218,23 @@ class ScheduleAdmin(admin.ModelAdmin):
     get_show_name.admin_order_field = 'show'
     get_show_name.short_description = "Show"
 
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        if db_field.name == 'automation_id':
+            return automation_id_formfield(db_field, **kwargs)
+
+        return super(ScheduleAdmin, self).formfield_for_dbfield(db_field, request, **kwargs)
+
 
 class ScheduleInline(admin.TabularInline):
     model = Schedule
     ordering = ('pk', '-until', 'byweekday')
 
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        if db_field.name == 'automation_id':
+            return automation_id_formfield(db_field, **kwargs)
+
+        return super(ScheduleInline, self).formfield_for_dbfield(db_field, request, **kwargs)
+
 
 class ShowAdmin(admin.ModelAdmin):
     filter_horizontal = ('hosts', 'owners', 'musicfocus', 'category', 'topic', 'language')
@@ -336,11 +358,6 @@ class ShowAdmin(admin.ModelAdmin):
         if request.POST.get('step') == None:
             # First save-show submit
 
-            # Generate thumbnails
-            if form.instance.image.name and settings.THUMBNAIL_SIZES:
-                for size in settings.THUMBNAIL_SIZES:
-                    thumbnail = form.instance.image.crop[size].name
-
             # Save show data only
             form.save();
 
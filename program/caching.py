@@ -0,0 +1,78 @@
+"""
+Caching of views showing what is on air
+
+Instead of a fixed timeout, responses are cached until the end of the entry on air in the
+timeline, i.e. the next timeslot boundary, and sent with a matching Cache-Control max-age. The
+cache key contains the program version and the start of the entry on air, so a changed program
+or a new entry is never answered from the cache. Clients keep their copy until max-age expires
+though, so the timeout is limited by BOUNDARY_CACHE_TIMEOUT, e.g. for long gaps of the default show.
+"""
+
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_response_headers
+from django.utils.translation import get_language
+
+from program.timeline import get_timeline
+from program.version import get_program_version
+
+
+def get_boundary_timeout(max_timeout=None):
+    """
+    Returns the start of the entry on air and the seconds until it ends
+    The seconds are at most max_timeout and BOUNDARY_CACHE_TIMEOUT, which also applies if nothing is on air
+    """
+
+    entry = get_timeline().current()
+    timeout = getattr(settings, 'BOUNDARY_CACHE_TIMEOUT', 60 * 60)
+
+    if max_timeout != None:
+        timeout = min(timeout, max_timeout)
+
+    if entry is None:
+        return None, timeout
+
+    return entry.start, max(min(timeout, int((entry.end - datetime.now()).total_seconds()) + 1), 1)
+
+
+def cache_until_boundary(max_timeout=None):
+    """
+    Decorator caching successful GET responses of a view until the next timeslot boundary
+    Use max_timeout for views which also change within a timeslot, e.g. the current track
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            start, timeout = get_boundary_timeout(max_timeout)
+            key = 'boundary:%s:%s:%s:%s' % (get_program_version(),
+                                            start.strftime('%Y%m%d%H%M%S') if start != None else '',
+                                            get_language(),
+                                            hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest())
+
+            response = cache.get(key)
+
+            if response is None:
+                response = view(request, *args, **kwargs)
+
+                if response.status_code != 200 or response.streaming:
+                    return response
+
+                if hasattr(response, 'render') and callable(response.render):
+                    response = response.render()
+
+                cache.set(key, response, timeout)
+
+            patch_response_headers(response, timeout)
+            return response
+
+        return wrapped
+
+    return decorator
@@ -0,0 +1,194 @@
+"""
+Resolver for direct audio URLs of CBA posts
+
+In order to retrieve the URLs, stations need
+   - to be whitelisted by CBA
+   - an API Key
+
+Therefore contact cba@fro.at
+
+Resolved URLs are kept in the CBAAudio table and fetched again once they are older than
+CBA_AUDIO_URL_TTL, failed lookups after CBA_AUDIO_URL_FAILED_TTL. Saving a note never waits
+for CBA: the URL is taken from the cache table or fetched in a background thread after the
+transaction was committed. The refresh_cba_audio_urls command refreshes stale entries.
+"""
+
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from program.models import CBAAudio, Note
+from program.version import bump_program_version
+
+
+logger = logging.getLogger(__name__)
+
+# Background threads resolving audio URLs of saved notes
+_executor = None
+
+
+def get_url(cba_id):
+    """Returns the URL of the CBA ajax handler returning the audio URL of a post"""
+    return settings.CBA_AJAX_URL + '?' + urlencode({'action': 'cba_ajax_get_filename', 'post_id': cba_id, 'api_key': settings.CBA_API_KEY})
+
+
+def fetch_audio_url(cba_id):
+    """
+    Requests the audio URL of a post from CBA
+    Raises an exception if CBA isn't reachable or returned something else than a URL
+    """
+
+    with urlopen(get_url(cba_id), timeout=getattr(settings, 'CBA_TIMEOUT', 10)) as conn:
+        audio_url = json.loads(conn.read().decode('utf-8-sig'))
+
+    if not isinstance(audio_url, str):
+        raise ValueError('Unexpected response for CBA post %s: %r' % (cba_id, audio_url))
+
+    return audio_url
+
+
+def is_fresh(entry, now=None):
+    """Whether a cache entry is younger than its TTL"""
+
+    now = now or timezone.now()
+
+    if entry.failed:
+        ttl = getattr(settings, 'CBA_AUDIO_URL_FAILED_TTL', 60 * 15)
+    else:
+        ttl = getattr(settings, 'CBA_AUDIO_URL_TTL', 60 * 60 * 24)
+
+    return entry.fetched + timedelta(seconds=ttl) > now
+
+
+def refresh(cba_ids, workers=None):
+    """
+    Fetches the audio URLs of the given posts concurrently, stores them and updates the notes linking them
+    Returns a dict of post IDs and cache entries
+    """
+
+    cba_ids = set(int(cba_id) for cba_id in cba_ids)
+
+    if not cba_ids or not settings.CBA_API_KEY:
+        return {}
+
+    def fetch(cba_id):
+        try:
+            return cba_id, fetch_audio_url(cba_id), False
+        except Exception as e:
+            logger.warning('Could not get audio URL of CBA post %s: %s', cba_id, e)
+            return cba_id, None, True
+
+    with ThreadPoolExecutor(max_workers=workers or getattr(settings, 'CBA_WORKERS', 4)) as executor:
+        results = list(executor.map(fetch, cba_ids))
+
+    entries = CBAAudio.objects.in_bulk(cba_ids)
+    now = timezone.now()
+    changed = False
+
+    for cba_id, audio_url, failed in results:
+        entry = entries.get(cba_id) or CBAAudio(cba_id=cba_id)
+
+        # Keep the last known URL if CBA failed
+        if not failed:
+            entry.audio_url = audio_url
+
+        entry.failed = failed
+        entry.fetched = now
+        entry.save()
+        entries[cba_id] = entry
+
+        if not failed and Note.objects.filter(cba_id=cba_id).exclude(audio_url=audio_url).update(audio_url=audio_url):
+            changed = True
+
+    # Notes were updated without sending signals
+    if changed:
+        bump_program_version()
+
+    return entries
+
+
+def resolve(cba_ids):
+    """
+    Returns a dict of post IDs and audio URLs, fetching only those not cached or stale
+    Failed lookups are left out
+    """
+
+    cba_ids = set(int(cba_id) for cba_id in cba_ids)
+    entries = CBAAudio.objects.in_bulk(cba_ids)
+    now = timezone.now()
+
+    stale = [cba_id for cba_id in cba_ids if cba_id not in entries or not is_fresh(entries[cba_id], now)]
+    entries.update(refresh(stale))
+
+    return {cba_id: entry.audio_url for cba_id, entry in entries.items() if entry.audio_url}
+
+
+def get_stale_ids():
+    """Returns IDs of posts linked by notes whose audio URL was never fetched or is stale"""
+
+    cba_ids = set(Note.objects.filter(cba_id__isnull=False).values_list('cba_id', flat=True))
+    entries = CBAAudio.objects.in_bulk(cba_ids)
+    now = timezone.now()
+
+    return sorted(cba_id for cba_id in cba_ids if cba_id not in entries or not is_fresh(entries[cba_id], now))
+
+
+def resolve_note(note):
+    """
+    Sets the audio URL of a note from the cache table
+    If the URL isn't cached or stale, it is fetched after the current transaction was committed
+    """
+
+    if note.cba_id == None or note.cba_id == '':
+        if note.audio_url:
+            set_audio_url(note, '')
+        return
+
+    entry = CBAAudio.objects.filter(cba_id=note.cba_id).first()
+
+    if entry is not None and entry.audio_url and note.audio_url != entry.audio_url:
+        set_audio_url(note, entry.audio_url)
+
+    if entry is None or not is_fresh(entry):
+        cba_ids = [int(note.cba_id)]
+
+        if getattr(settings, 'CBA_RESOLVE_IN_BACKGROUND', True):
+            transaction.on_commit(lambda: get_executor().submit(refresh_in_background, cba_ids))
+        else:
+            refresh(cba_ids)
+            note.audio_url = Note.objects.filter(pk=note.pk).values_list('audio_url', flat=True).first() or ''
+
+
+def set_audio_url(note, audio_url):
+    """Updates the audio URL of a saved note without saving it again"""
+
+    Note.objects.filter(pk=note.pk).update(audio_url=audio_url)
+    note.audio_url = audio_url
+    bump_program_version()
+
+
+def get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1)
+
+    return _executor
+
+
+def refresh_in_background(cba_ids):
+    """Refreshes audio URLs in a background thread, which needs its own database connection"""
+
+    try:
+        refresh(cba_ids)
+    except Exception:
+        logger.exception('Could not refresh audio URLs of CBA posts %s', cba_ids)
+    finally:
+        connection.close()
@@ -1,8 +1,28 @@
 from django import forms
+from django.conf import settings
+from django.db.models.fields import BLANK_CHOICE_DASH
 from django.forms import ModelForm, ValidationError
 from django.core.files.images import get_image_dimensions
 
 from program.models import MusicFocus, Category, Topic
+from program.utils import get_automation_id_choices
+
+
+def get_automation_id_form_choices():
+    return BLANK_CHOICE_DASH + get_automation_id_choices()
+
+
+def automation_id_formfield(db_field, **kwargs):
+    """
+    Returns a select for automation IDs whose choices are fetched when the form is instantiated
+    Returns the default form field if no automation is configured
+    """
+
+    if not getattr(settings, 'AUTOMATION_BASE_URL', None):
+        return db_field.formfield(**kwargs)
+
+    return forms.TypedChoiceField(label=db_field.verbose_name, choices=get_automation_id_form_choices,
+                                  coerce=int, empty_value=None, required=False)
 
 
 class FormWithButton(ModelForm):
@@ -0,0 +1,167 @@
+"""
+Interval index for timeslots
+
+On SQLite builds with the R*Tree module, the start and end of every timeslot are mirrored
+into an R*Tree virtual table which answers "overlaps [a, b]" lookups in logarithmic time.
+The R*Tree only serves as a pre-filter: it stores 32-bit floats rounded outwards, so the
+exact range predicates still have to be applied to the timeslot table itself.
+
+Other backends (or SQLite builds without R*Tree) rely on the composite B-tree indexes
+on (start, end) and (end, start) of the timeslot table instead.
+
+Range lookups trust the R*Tree, so it is kept in sync by the timeslot signals and the bulk
+paths of the TimeSlotManager. If timeslots were written around them (e.g. raw SQL or
+QuerySet.update), run the rebuild_timeslot_index command.
+"""
+
+from calendar import timegm
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+RTREE_TABLE = 'program_timeslot_rtree'
+
+# Whether the R*Tree table exists, per database alias
+_available = {}
+
+
+def to_epoch(dt):
+    """Returns the seconds since epoch of a datetime the way it is stored in the database"""
+
+    # Timeslots may be created with strings, e.g. from admin forms
+    if isinstance(dt, str):
+        dt = parse_datetime(dt)
+
+    if settings.USE_TZ and timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+
+    if timezone.is_aware(dt):
+        return timegm(dt.utctimetuple())
+
+    return timegm(dt.timetuple())
+
+
+class RawSubquery(RawSQL):
+    """A raw SELECT as the right-hand side of __in, which adds the parentheses itself"""
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def create_rtree(connection, model=None):
+    """
+    Creates and fills the R*Tree table if the backend supports it
+    Migrations pass the historical TimeSlot model to fill it from
+    Returns True on success
+    """
+
+    if connection.vendor != 'sqlite':
+        return False
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS %s USING rtree(id, start_ts, end_ts)' % RTREE_TABLE)
+    except DatabaseError:
+        # SQLite was compiled without R*Tree
+        return False
+
+    _available[connection.alias] = True
+    rebuild(connection.alias, model)
+    return True
+
+
+def drop_rtree(connection):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS %s' % RTREE_TABLE)
+
+    _available[connection.alias] = False
+
+
+def is_available(using=DEFAULT_DB_ALIAS):
+    """Whether the R*Tree table exists in the given database"""
+
+    if using not in _available:
+        connection = connections[using]
+
+        if connection.vendor != 'sqlite':
+            _available[using] = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=%s", [RTREE_TABLE])
+                _available[using] = cursor.fetchone() is not None
+
+    return _available[using]
+
+
+def rebuild(using=DEFAULT_DB_ALIAS, model=None):
+    """
+    Refills the R*Tree table from the timeslot table, read through the given model (TimeSlot if None)
+    Returns the number of indexed timeslots
+    """
+
+    if not is_available(using):
+        return 0
+
+    if model is None:
+        from program.models import TimeSlot as model
+
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % RTREE_TABLE)
+
+    entries = list(model._default_manager.using(using).values_list('id', 'start', 'end'))
+    index(entries, using)
+
+    return len(entries)
+
+
+def index(entries, using=DEFAULT_DB_ALIAS):
+    """Adds or updates (id, start, end) tuples in the R*Tree, used by signals and bulk paths"""
+
+    if not is_available(using):
+        return
+
+    params = [(pk, to_epoch(start), to_epoch(end)) for pk, start, end in entries]
+
+    if params:
+        with connections[using].cursor() as cursor:
+            cursor.executemany('INSERT OR REPLACE INTO %s (id, start_ts, end_ts) VALUES (%%s, %%s, %%s)' % RTREE_TABLE, params)
+
+
+def index_timeslots(timeslots, using=DEFAULT_DB_ALIAS):
+    """Adds or updates timeslot objects in the R*Tree"""
+    index([(ts.id, ts.start, ts.end) for ts in timeslots if ts.id is not None], using)
+
+
+def unindex(ids, using=DEFAULT_DB_ALIAS):
+    """Removes timeslot IDs from the R*Tree"""
+
+    if not is_available(using):
+        return
+
+    ids = [(pk,) for pk in ids]
+
+    if ids:
+        with connections[using].cursor() as cursor:
+            cursor.executemany('DELETE FROM %s WHERE id = %%s' % RTREE_TABLE, ids)
+
+
+def filter_overlapping(queryset, start, end):
+    """
+    Narrows down a timeslot queryset to timeslots possibly overlapping [start, end] using the R*Tree
+    Returns the queryset unchanged if no R*Tree is available
+
+    The result is a superset: exact predicates on start and end must still be applied
+    """
+
+    if not is_available(queryset.db):
+        return queryset
+
+    # A lookup instead of extra(where=...) lets Django qualify the column, e.g. in subqueries
+    ids = RawSubquery('SELECT id FROM %s WHERE start_ts <= %%s AND end_ts >= %%s' % RTREE_TABLE, (to_epoch(end), to_epoch(start)))
+    return queryset.filter(id__in=ids)
+
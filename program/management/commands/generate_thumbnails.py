@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from program import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'renders thumbnails of all images of hosts, shows and notes using all cores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', default=thumbnails.THUMBNAIL_MODELS, help='Models to render thumbnails for, e.g. program.Show')
+        parser.add_argument('--workers', type=int, dest='workers', default=None, help='Number of worker processes, defaults to the number of cores.')
+
+    def handle(self, *args, **options):
+        jobs = thumbnails.get_all_jobs(options['models'])
+        rendered = thumbnails.render_all(jobs, options['workers'])
+
+        self.stdout.write('Thumbnails of %d of %d images rendered.' % (rendered, len(jobs)))
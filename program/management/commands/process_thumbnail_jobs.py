@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from program import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'renders thumbnails of saved images in a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', dest='once', default=False, help='Processes queued jobs and exits instead of waiting for new ones.')
+        parser.add_argument('--interval', type=float, dest='interval', default=getattr(settings, 'THUMBNAIL_JOB_INTERVAL', 5), help='Seconds to wait for new jobs.')
+        parser.add_argument('--workers', type=int, dest='workers', default=None, help='Number of worker processes, defaults to the number of cores.')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = thumbnails.process_jobs(workers=options['workers'])
+
+            if processed:
+                self.stdout.write('%d thumbnail jobs processed.' % processed)
+                continue
+
+            if options['once']:
+                return
+
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from program.models import TimeSlotChange
+
+
+class Command(BaseCommand):
+    help = 'deletes logged timeslot changes older than PLAYOUT_CHANGES_RETENTION_DAYS, meant to run nightly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', dest='days', type=int, default=getattr(settings, 'PLAYOUT_CHANGES_RETENTION_DAYS', 30),
+                            help='Days to keep changes for')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%d timeslot changes pruned.' % TimeSlotChange.objects.prune(options['days']))
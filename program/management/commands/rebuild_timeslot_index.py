@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from program import intervals
+
+
+class Command(BaseCommand):
+    help = 'rebuilds the interval index of timeslots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', dest='database', default=DEFAULT_DB_ALIAS, help='Specifies the database to use.')
+
+    def handle(self, *args, **options):
+        using = options['database']
+
+        if not intervals.is_available(using) and not intervals.create_rtree(connections[using]):
+            self.stdout.write('R*Tree is not supported by this database, using B-tree indexes instead.')
+            return
+
+        self.stdout.write('%d timeslots indexed.' % intervals.rebuild(using))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from program.utils import fetch_automation_shows
+
+
+class Command(BaseCommand):
+    help = 'refreshes the cached shows of the automation used for automation ID choices'
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'AUTOMATION_BASE_URL', None):
+            self.stdout.write('AUTOMATION_BASE_URL is not set, using the cached shows only.')
+
+        shows = fetch_automation_shows()
+
+        self.stdout.write('%d shows and %d multi-shows cached.' % (len(shows.get('shows', [])), len(shows.get('multi-shows', []))))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from program import cba
+from program.models import Note
+
+
+class Command(BaseCommand):
+    help = 'fetches audio URLs of CBA posts linked by notes which were never fetched or are stale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all', default=False, help='Refreshes all audio URLs, not only stale ones.')
+        parser.add_argument('--workers', type=int, dest='workers', default=None, help='Number of concurrent requests to CBA.')
+
+    def handle(self, *args, **options):
+        if not settings.CBA_API_KEY:
+            self.stdout.write('CBA_API_KEY is not set, requests to CBA are disabled.')
+            return
+
+        if options['all']:
+            cba_ids = sorted(set(Note.objects.filter(cba_id__isnull=False).values_list('cba_id', flat=True)))
+        else:
+            cba_ids = cba.get_stale_ids()
+
+        entries = cba.refresh(cba_ids, workers=options['workers'])
+        failed = len([entry for entry in entries.values() if entry.failed])
+
+        self.stdout.write('%d audio URLs refreshed, %d failed.' % (len(entries) - failed, failed))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from program.models import Show
+
+
+class Command(BaseCommand):
+    help = 'recomputes the last date shows and hosts are scheduled on, meant to run nightly'
+
+    def handle(self, *args, **options):
+        self.stdout.write('%d shows and their hosts updated.' % Show.update_active_until())
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 10:06
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from program import intervals
+
+
+def create_rtree(apps, schema_editor):
+    # Fill it through the model of this migration's state, not the current one
+    intervals.create_rtree(schema_editor.connection, apps.get_model('program', 'TimeSlot'))
+
+
+def drop_rtree(apps, schema_editor):
+    intervals.drop_rtree(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('program', '0013_auto_20180124_1748'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(fields=['start', 'end'], name='program_tim_start_e5312c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeslot',
+            index=models.Index(fields=['end', 'start'], name='program_tim_end_ab20ad_idx'),
+        ),
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 10:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('program', '0014_timeslot_interval_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeSlotChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timeslot_id', models.IntegerField(verbose_name='Time slot ID')),
+                ('action', models.CharField(choices=[('upsert', 'Created or updated'), ('delete', 'Deleted')], max_length=6, verbose_name='Action')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Time slot change',
+                'verbose_name_plural': 'Time slot changes',
+                'ordering': ('id',),
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 10:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('program', '0015_timeslotchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CBAAudio',
+            fields=[
+                ('cba_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='CBA ID')),
+                ('audio_url', models.TextField(blank=True, verbose_name='Direct URL to a linked audio file')),
+                ('failed', models.BooleanField(default=False, verbose_name='Failed')),
+                ('fetched', models.DateTimeField(verbose_name='Fetched')),
+            ],
+            options={
+                'verbose_name': 'CBA audio URL',
+                'verbose_name_plural': 'CBA audio URLs',
+                'ordering': ('cba_id',),
+            },
+        ),
+    ]
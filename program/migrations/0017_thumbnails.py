@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 10:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('program', '0016_cbaaudio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=64, verbose_name='Model')),
+                ('object_id', models.IntegerField(verbose_name='Object ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Thumbnail job',
+                'verbose_name_plural': 'Thumbnail jobs',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='thumbnails',
+            field=models.TextField(blank=True, editable=False, verbose_name='Thumbnails'),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='thumbnails',
+            field=models.TextField(blank=True, editable=False, verbose_name='Thumbnails'),
+        ),
+        migrations.AddField(
+            model_name='show',
+            name='thumbnails',
+            field=models.TextField(blank=True, editable=False, verbose_name='Thumbnails'),
+        ),
+    ]
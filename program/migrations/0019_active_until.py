@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 10:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, When
+
+
+def update_active_until(apps, schema_editor):
+    Host = apps.get_model('program', 'Host')
+    Show = apps.get_model('program', 'Show')
+    Schedule = apps.get_model('program', 'Schedule')
+
+    last = Schedule.objects.filter(show=OuterRef('pk')) \
+                           .annotate(last=Case(When(rrule_id=1, then=F('dstart')), default=F('until'), output_field=models.DateField())) \
+                           .order_by('-last')
+    Show.objects.update(active_until=Subquery(last.values('last')[:1]))
+
+    last = Show.objects.filter(hosts=OuterRef('pk'), active_until__isnull=False).order_by('-active_until')
+    Host.objects.update(active_until=Subquery(last.values('active_until')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('program', '0018_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='active_until',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='Active until'),
+        ),
+        migrations.AddField(
+            model_name='show',
+            name='active_until',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='Active until'),
+        ),
+        migrations.RunPython(update_active_until, migrations.RunPython.noop),
+    ]
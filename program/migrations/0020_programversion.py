@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 11:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('program', '0019_active_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgramVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='Version')),
+            ],
+            options={
+                'verbose_name': 'Program version',
+                'verbose_name_plural': 'Program versions',
+            },
+        ),
+    ]
@@ -1,9 +1,13 @@
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ValidationError, MultipleObjectsReturned
 from django.urls import reverse
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
 from django.forms.models import model_to_dict
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from versatileimagefield.fields import VersatileImageField, PPOIField
 from django.conf import settings
@@ -11,10 +15,12 @@ from django.conf import settings
 from tinymce import models as tinymce_models
 
 from datetime import date, datetime, time, timedelta
-from dateutil.relativedelta import relativedelta
-from dateutil.rrule import rrule
+from uuid import uuid4
 
-from .utils import get_automation_id_choices
+from . import intervals, recurrence
+from .recurrence import ProjectedSlot
+from .version import bump_program_version
+from .utils import to_naive
 
 from pv.settings import THUMBNAIL_SIZES, AUTO_SET_UNTIL_DATE_TO_END_OF_YEAR, AUTO_SET_UNTIL_DATE_TO_DAYS_IN_FUTURE
 
@@ -263,6 +269,8 @@ class Host(models.Model):
     height = models.PositiveIntegerField('Image Height', blank=True, null=True, editable=False)
     width = models.PositiveIntegerField('Image Width', blank=True, null=True,editable=False)
     image = VersatileImageField(_("Profile picture"), blank=True, null=True, upload_to='host_images', width_field='width', height_field='height', ppoi_field='ppoi', help_text=_("Upload a picture of yourself. Images are automatically cropped around the 'Primary Point of Interest'. Click in the image to change it and press Save."))
+    thumbnails = models.TextField(_("Thumbnails"), blank=True, editable=False)
+    active_until = models.DateField(_("Active until"), blank=True, null=True, editable=False, db_index=True) # Last date of the host's shows, see update_active_until
 
     class Meta:
         ordering = ('name',)
@@ -276,7 +284,16 @@ class Host(models.Model):
         return reverse('host-detail', args=[str(self.id)])
 
     def active_shows(self):
-        return self.shows.filter(schedules__until__gt=datetime.today())
+        return self.shows.filter(active_until__gt=date.today())
+
+    @staticmethod
+    def update_active_until(host_ids=None):
+        """Recomputes the last date the shows of the given hosts (all if None) are scheduled on"""
+
+        hosts = Host.objects.all() if host_ids is None else Host.objects.filter(pk__in=list(host_ids))
+        last = Show.objects.filter(hosts=OuterRef('pk'), active_until__isnull=False).order_by('-active_until')
+
+        return hosts.update(active_until=Subquery(last.values('active_until')[:1]))
 
     def is_editable(self, host_id):
         """
@@ -289,14 +306,6 @@ class Host(models.Model):
         host_ids = Host.objects.filter(shows__in=self.request.user.shows.all()).distinct().values_list('id', flat=True)
         return int(host_id) in host_ids
 
-    def save(self, *args, **kwargs):
-        super(Host, self).save(*args, **kwargs)
-
-        # Generate thumbnails
-        if self.image.name and THUMBNAIL_SIZES:
-            for size in THUMBNAIL_SIZES:
-                thumbnail = self.image.crop[size].name
-
 
 class Show(models.Model):
     predecessor = models.ForeignKey('self', blank=True, null=True, related_name='successors', verbose_name=_("Predecessor"))
@@ -314,6 +323,7 @@ class Show(models.Model):
     height = models.PositiveIntegerField('Image Height', blank=True, null=True, editable=False)
     width = models.PositiveIntegerField('Image Width', blank=True, null=True,editable=False)
     image = VersatileImageField(_("Image"), blank=True, null=True, upload_to='show_images', width_field='width', height_field='height', ppoi_field='ppoi', help_text=_("Upload an image to your show. Images are automatically cropped around the 'Primary Point of Interest'. Click in the image to change it and press Save."))
+    thumbnails = models.TextField(_("Thumbnails"), blank=True, editable=False)
     logo = models.ImageField(_("Logo"), blank=True, null=True, upload_to='show_images')
     short_description = models.TextField(_("Short description"), help_text=_("Describe your show in some sentences. Avoid technical data like airing times and contact information. They will be added automatically."))
     description = tinymce_models.HTMLField(_("Description"), blank=True, null=True, help_text=_("Describe your show in detail."))
@@ -321,6 +331,7 @@ class Show(models.Model):
     website = models.URLField(_("Website"), blank=True, null=True, help_text=_("Is there a website to your show? Type in its URL."))
     cba_series_id = models.IntegerField(_("CBA Series ID"), blank=True, null=True, help_text=_("Link your show to a CBA series by giving its ID. This will enable CBA upload and will automatically link your show to your CBA archive. Find out your ID under https://cba.fro.at/series"))
     fallback_id = models.IntegerField(_("Fallback ID"), blank=True, null=True)
+    active_until = models.DateField(_("Active until"), blank=True, null=True, editable=False, db_index=True) # Last date of the show's schedules, see update_active_until
     created = models.DateTimeField(auto_now_add=True, editable=False)
     last_updated = models.DateTimeField(auto_now=True, editable=False)
 
@@ -353,6 +364,27 @@ class Show(models.Model):
         show_ids = self.request.user.shows.all().values_list('id', flat=True)
         return int(show_id) in show_ids
 
+    @staticmethod
+    def update_active_until(show_ids=None):
+        """
+        Recomputes the last date the given shows (all if None) are scheduled on, and of their hosts
+        Single timeslots take place on their first date regardless of the until date
+        """
+
+        shows = Show.objects.all() if show_ids is None else Show.objects.filter(pk__in=list(show_ids))
+        last = Schedule.objects.filter(show=OuterRef('pk')) \
+                               .annotate(last=Case(When(rrule_id=1, then=F('dstart')), default=F('until'), output_field=models.DateField())) \
+                               .order_by('-last')
+
+        updated = shows.update(active_until=Subquery(last.values('last')[:1]))
+
+        if show_ids is None:
+            Host.update_active_until()
+        else:
+            Host.update_active_until(Show.hosts.through.objects.filter(show_id__in=list(show_ids)).values_list('host_id', flat=True))
+
+        return updated
+
 
 class RRule(models.Model):
 
@@ -406,7 +438,7 @@ class Schedule(models.Model):
     until = models.DateField(_("Last date"))
     is_repetition = models.BooleanField(_("Is repetition"), default=False)
     fallback_id = models.IntegerField(_("Fallback ID"), blank=True, null=True)
-    automation_id = models.IntegerField(_("Automation ID"), blank=True, null=True, choices=get_automation_id_choices()) # Deprecated
+    automation_id = models.IntegerField(_("Automation ID"), blank=True, null=True) # Deprecated, choices are added by forms
     created = models.DateTimeField(auto_now_add=True, editable=False, null=True) #-> both see https://stackoverflow.com/questions/1737017/django-auto-now-and-auto-now-add
     last_updated = models.DateTimeField(auto_now=True, editable=False, null=True)
 
@@ -473,109 +505,70 @@ class Schedule(models.Model):
 
     def generate_timeslots(schedule):
         """
-        Returns a list of timeslot objects based on a schedule and its rrule
+        Returns a list of projected slots based on a schedule and its rrule
         Returns past timeslots as well, starting from dstart (not today)
         """
 
-        byweekno = None
-        byweekno_end = None
-        byweekday_end = int(schedule.byweekday)
-        starts = []
-        ends = []
-        timeslots = []
-
-        # Handle ending weekday for timeslots over midnight
-        if schedule.tend < schedule.tstart:
-            if schedule.byweekday < 6:
-                byweekday_end = int(schedule.byweekday + 1)
-            else:
-                byweekday_end = 0
+        return list(recurrence.expand_schedule(schedule))
 
-        # Handle ending dates for timeslots over midnight
-        if schedule.tend < schedule.tstart:
-            dend = schedule.dstart + timedelta(days=+1)
-        else:
-            dend = schedule.dstart
-
-        if schedule.rrule.freq == 0: # Ignore weekdays for one-time timeslots
-            byweekday_start = None
-            byweekday_end = None
-        elif schedule.rrule.freq == 3 and schedule.rrule.pk == 2: # Daily timeslots
-            byweekday_start = (0, 1, 2, 3, 4, 5, 6)
-            byweekday_end = (0, 1, 2, 3, 4, 5, 6)
-        elif schedule.rrule.freq == 3 and schedule.rrule.pk == 3: # Business days MO - FR/SA
-            byweekday_start = (0, 1, 2, 3, 4)
-            if schedule.tend < schedule.tstart:
-                # End days for over midnight
-                byweekday_end = (1, 2, 3, 4, 5)
-            else:
-                byweekday_end = (0, 1, 2, 3, 4)
-        elif schedule.rrule.freq == 2 and schedule.rrule.pk == 7: # Even calendar weeks
-            byweekday_start = int(schedule.byweekday)
-            byweekno = list(range(2, 54, 2))
-            # Reverse ending weeks if from Sun - Mon
-            if byweekday_start == 6 and byweekday_end == 0:
-                byweekno_end = list(range(1, 54, 2))
-            else:
-                byweekno_end = byweekno
-        elif schedule.rrule.freq == 2 and schedule.rrule.pk == 8: # Odd calendar weeks
-            byweekday_start = int(schedule.byweekday)
-            byweekno = list(range(1, 54, 2))
-            # Reverse ending weeks if from Sun - Mon
-            if byweekday_start == 6 and byweekday_end == 0:
-                byweekno_end = list(range(2, 54, 2))
-            else:
-                byweekno_end = byweekno
-        else:
-            byweekday_start = int(schedule.byweekday)
 
-        if schedule.rrule.freq == 0:
-            starts.append(datetime.combine(schedule.dstart, schedule.tstart))
-            ends.append(datetime.combine(dend, schedule.tend))
-        else:
+    def match_collisions(timeslots):
+        """
+        Matches a list of projected slots against existing timeslots in the database
+        Fetches all timeslots within the overall timerange in one query and sweeps through them
+        Returns a list of lists of colliding timeslots (ordered by start), keeping indices from input list
+        """
 
-            starts = list(rrule(freq=schedule.rrule.freq,
-                            dtstart=datetime.combine(schedule.dstart, schedule.tstart),
-                            interval=schedule.rrule.interval,
-                            until=schedule.until + relativedelta(days=+1),
-                            bysetpos=schedule.rrule.bysetpos,
-                            byweekday=byweekday_start,
-                            byweekno=byweekno))
-
-            ends = list(rrule(freq=schedule.rrule.freq,
-                          dtstart=datetime.combine(dend, schedule.tend),
-                          interval=schedule.rrule.interval,
-                          until=schedule.until + relativedelta(days=+1),
-                          bysetpos=schedule.rrule.bysetpos,
-                          byweekday=byweekday_end,
-                          byweekno=byweekno_end))
-
-        for k in range(min(len(starts), len(ends))):
-            timeslots.append(TimeSlot(schedule=schedule, start=starts[k], end=ends[k]).generate())
+        matches = [[] for ts in timeslots]
 
-        return timeslots
+        if len(timeslots) < 1:
+            return matches
+
+        def overlaps(ts, c_start, c_end):
+            return ( ( c_start < ts.end_ts and c_end >= ts.end_ts ) or
+                     ( c_end > ts.start_ts and c_end <= ts.end_ts ) or
+                     ( c_start >= ts.start_ts and c_end <= ts.end_ts ) or
+                     ( c_start <= ts.start_ts and c_end >= ts.end_ts ) )
+
+        window_start = recurrence.from_timestamp(min(ts.start_ts for ts in timeslots))
+        window_end = recurrence.from_timestamp(max(ts.end_ts for ts in timeslots))
+
+        # Existing timeslots are timezone-aware if USE_TZ is set, projected ones are local timestamps
+        existing = [(recurrence.to_timestamp(to_naive(c.start)), recurrence.to_timestamp(to_naive(c.end)), c)
+                    for c in TimeSlot.objects.get_window_timeslots(window_start, window_end).select_related('show').order_by('start')]
+
+        # Projected timeslots in order of their start, existing ones become active once they start before
+        # the projected one ends and are dropped as soon as they end before it starts
+        active = []
+        k = 0
+
+        for index in sorted(range(len(timeslots)), key=lambda i: timeslots[i].start_ts):
+            ts = timeslots[index]
+
+            while k < len(existing) and existing[k][0] <= ts.end_ts:
+                active.append(existing[k])
+                k += 1
+
+            active = [a for a in active if a[1] >= ts.start_ts]
+
+            matches[index] = [c for c_start, c_end, c in active if overlaps(ts, c_start, c_end)]
+
+        return matches
 
 
     def get_collisions(timeslots):
         """
-        Tests a list of timeslot objects for colliding timeslots in the database
+        Tests a list of projected slots for colliding timeslots in the database
         Returns a list of collisions, containing colliding timeslot IDs or None
         Keeps indices from input list for later comparison
         """
 
         collisions = []
 
-        for ts in timeslots:
-
-            collision = TimeSlot.objects.filter(
-                           ( Q(start__lt=ts.end) & Q(end__gte=ts.end) ) |
-                           ( Q(end__gt=ts.start) & Q(end__lte=ts.end) ) |
-                           ( Q(start__gte=ts.start) & Q(end__lte=ts.end) ) |
-                           ( Q(start__lte=ts.start) & Q(end__gte=ts.end) )
-                        )
+        for collision_list in Schedule.match_collisions(timeslots):
 
-            if collision:
-                collisions.append(collision[0]) # TODO: Do we really always retrieve one?
+            if collision_list:
+                collisions.append(collision_list[0]) # TODO: Do we really always retrieve one?
             else:
                 collisions.append(None)
 
@@ -584,7 +577,7 @@ class Schedule(models.Model):
 
     def generate_conflicts(timeslots):
         """
-        Tests a list of timeslot objects for colliding timeslots in the database
+        Tests a list of projected slots for colliding timeslots in the database
         Returns a list of conflicts containing dicts of projected timeslots, collisions and solutions
         """
 
@@ -592,8 +585,15 @@ class Schedule(models.Model):
         projected = []
         solutions = {}
 
+        # Get collisions for all timeslots at once
+        collision_lists = Schedule.match_collisions(timeslots)
+
+        # Get notes of colliding timeslots
+        collision_ids = [c.id for collision_list in collision_lists for c in collision_list]
+        notes = dict(Note.objects.filter(timeslot__in=collision_ids).values_list('timeslot_id', 'id'))
+
         # Cycle each timeslot
-        for ts in timeslots:
+        for ts, collision_list in zip(timeslots, collision_lists):
 
             # Contains one conflict: a projected timeslot, collisions and solutions
             conflict = {}
@@ -604,14 +604,6 @@ class Schedule(models.Model):
             # Contains possible solutions
             solution_choices = set()
 
-            # Get collisions for each timeslot
-            collision_list = list(TimeSlot.objects.filter(
-                           ( Q(start__lt=ts.end) & Q(end__gte=ts.end) ) |
-                           ( Q(end__gt=ts.start) & Q(end__lte=ts.end) ) |
-                           ( Q(start__gte=ts.start) & Q(end__lte=ts.end) ) |
-                           ( Q(start__lte=ts.start) & Q(end__gte=ts.end) )
-                        ).order_by('start'))
-
             # Add the projected timeslot
             projected_entry = {}
             projected_entry['hash'] = ts.hash
@@ -620,6 +612,9 @@ class Schedule(models.Model):
 
             for c in collision_list:
 
+                c_start = recurrence.to_timestamp(to_naive(c.start))
+                c_end = recurrence.to_timestamp(to_naive(c.end))
+
                 # Add the collision
                 collision = {}
                 collision['id'] = c.id
@@ -633,11 +628,8 @@ class Schedule(models.Model):
                 collision['memo'] = c.memo
 
                 # Get note
-                try:
-                    note = Note.objects.get(timeslot=c.id).values_list('id', flat=True)
-                    collision['note_id'] = note
-                except ObjectDoesNotExist:
-                    pass
+                if c.id in notes:
+                    collision['note_id'] = notes[c.id]
 
                 collisions.append(collision)
 
@@ -663,7 +655,7 @@ class Schedule(models.Model):
                     #   |  |
                     #   +--+
                     #
-                    if ts.start < c.start and ts.end > c.start and ts.end <= c.end:
+                    if ts.start_ts < c_start and ts.end_ts > c_start and ts.end_ts <= c_end:
                         solution_choices.add('theirs-end')
                         solution_choices.add('ours-end')
 
@@ -677,7 +669,7 @@ class Schedule(models.Model):
                     #        |  |
                     #        +--+
                     #
-                    if ts.start >= c.start and ts.start < c.end and ts.end > c.end:
+                    if ts.start_ts >= c_start and ts.start_ts < c_end and ts.end_ts > c_end:
                         solution_choices.add('theirs-start')
                         solution_choices.add('ours-start')
 
@@ -690,7 +682,7 @@ class Schedule(models.Model):
                     #   +--+ |  |
                     #        +--+
                     #
-                    if ts.start < c.start and ts.end > c.end:
+                    if ts.start_ts < c_start and ts.end_ts > c_end:
                         solution_choices.add('theirs-end')
                         solution_choices.add('theirs-start')
                         solution_choices.add('theirs-both')
@@ -704,7 +696,7 @@ class Schedule(models.Model):
                     #   |  | +--+
                     #   +--+
                     #
-                    if ts.start > c.start and ts.end < c.end:
+                    if ts.start_ts > c_start and ts.end_ts < c_end:
                         solution_choices.add('ours-end')
                         solution_choices.add('ours-start')
                         solution_choices.add('ours-both')
@@ -754,9 +746,73 @@ class Schedule(models.Model):
         conflicts = Schedule.generate_conflicts(timeslots)
         conflicts['schedule'] = model_to_dict(schedule)
 
+        # Keep the projection for resolving the conflicts later
+        Schedule.store_conflicts(conflicts, timeslots, sdl, schedule_pk, show_pk)
+
         return conflicts
 
 
+    def get_conflicts_key(sdl, schedule_pk, show_pk):
+        """Returns what a projection depends on, to tell whether a conflict session matches the submitted schedule"""
+
+        fields = ('rrule', 'byweekday', 'dstart', 'tstart', 'tend', 'until', 'is_repetition', 'fallback_id', 'automation_id')
+        return (str(schedule_pk), str(show_pk)) + tuple(str(sdl.get(field)) for field in fields)
+
+
+    def store_conflicts(conflicts, timeslots, sdl, schedule_pk, show_pk):
+        """
+        Stores conflicts in a session and adds its token and version stamp to them
+        The stamp is the settled timeslot change when the collisions were generated, see get_settled_version
+        """
+
+        conflicts['session'] = uuid4().hex
+        conflicts['stamp'] = TimeSlotChange.objects.get_settled_version()
+
+        session = {
+            'key': Schedule.get_conflicts_key(sdl, schedule_pk, show_pk),
+            'window': (recurrence.from_timestamp(min(ts.start_ts for ts in timeslots)),
+                       recurrence.from_timestamp(max(ts.end_ts for ts in timeslots))) if timeslots else None,
+            'collision_ids': set(c['id'] for ts in conflicts['projected'] for c in ts['collisions']),
+            'conflicts': conflicts,
+        }
+
+        cache.set('conflicts:%s' % conflicts['session'], session, getattr(settings, 'CONFLICT_SESSION_TIMEOUT', 60 * 30))
+
+
+    def load_conflicts(data, schedule_pk, show_pk):
+        """
+        Returns the conflicts stored in the session given by data or None if they're outdated
+
+        Conflicts are outdated if the schedule data changed or if a colliding timeslot or one
+        within the range of the projected timeslots was created, updated or deleted in the meantime
+        """
+
+        if not data.get('session') or data.get('stamp') == None:
+            return None
+
+        session = cache.get('conflicts:%s' % data['session'])
+
+        if session is None or session['key'] != Schedule.get_conflicts_key(data['schedule'], schedule_pk, show_pk):
+            return None
+
+        if str(session['conflicts']['stamp']) != str(data['stamp']):
+            return None
+
+        upserted, deleted = TimeSlotChange.objects.get_changes_since(session['conflicts']['stamp'])
+        changed = set(upserted) | set(deleted)
+
+        if not changed:
+            return session['conflicts']
+
+        if changed & session['collision_ids']:
+            return None
+
+        if session['window'] != None and TimeSlot.objects.get_window_timeslots(*session['window']).filter(id__in=changed).exists():
+            return None
+
+        return session['conflicts']
+
+
     def resolve_conflicts(data, schedule_pk, show_pk):
         """
         Resolves conflicts
@@ -769,10 +825,14 @@ class Schedule(models.Model):
         sdl = data['schedule']
         solutions = data['solutions']
 
-        # Regenerate conflicts
         schedule = Schedule.instantiate_upcoming(sdl, show_pk, schedule_pk)
         show = schedule.show
-        conflicts = Schedule.make_conflicts(sdl, schedule_pk, show_pk)
+
+        # Reuse the conflicts of the session if still valid, otherwise regenerate them
+        conflicts = Schedule.load_conflicts(data, schedule_pk, show_pk)
+
+        if conflicts is None:
+            conflicts = Schedule.make_conflicts(sdl, schedule_pk, show_pk)
 
         if schedule.rrule.freq > 0 and schedule.dstart == schedule.until:
             return {'detail': _("Start and until dates mustn't be the same")}
@@ -785,7 +845,7 @@ class Schedule(models.Model):
         if len(solutions) != num_conflicts:
             return {'detail': _("Numbers of conflicts and solutions don't match.")}
 
-        # Projected timeslots to create
+        # Projected slots to create
         create = []
 
         # Existing timeslots to update
@@ -797,6 +857,13 @@ class Schedule(models.Model):
         # Error messages
         errors = {}
 
+        # Colliding timeslots which might be updated or deleted
+        collision_ids = [c['id'] for ts in conflicts['projected'] for c in ts['collisions']]
+        existing_timeslots = TimeSlot.objects.in_bulk(collision_ids)
+
+        def project(start, end):
+            return ProjectedSlot.parse(start, end, schedule.rrule_id, schedule.byweekday)
+
         for ts in conflicts['projected']:
 
             # Ignore past dates
@@ -808,7 +875,7 @@ class Schedule(models.Model):
             #     - Create the projected timeslot and skip
             #
             if not 'solution_choices' in ts or len(ts['collisions']) < 1:
-                projected_ts = TimeSlot.objects.instantiate(ts['start'], ts['end'], schedule, show)
+                projected_ts = project(ts['start'], ts['end'])
                 create.append(projected_ts)
                 continue
 
@@ -854,16 +921,13 @@ class Schedule(models.Model):
             #     - Delete the existing collision(s)
             #
             if solution == 'ours':
-                projected_ts = TimeSlot.objects.instantiate(ts['start'], ts['end'], schedule, show)
+                projected_ts = project(ts['start'], ts['end'])
                 create.append(projected_ts)
 
                 # Delete collision(s)
                 for ex in ts['collisions']:
-                    try:
-                        existing_ts = TimeSlot.objects.get(pk=ex['id'])
-                        delete.append(existing_ts)
-                    except ObjectDoesNotExist:
-                        pass
+                    if ex['id'] in existing_timeslots:
+                        delete.append(existing_timeslots[ex['id']])
 
 
             # theirs-end
@@ -872,7 +936,7 @@ class Schedule(models.Model):
             #     - Create projected with end of existing start
             #
             if solution == 'theirs-end':
-                projected_ts = TimeSlot.objects.instantiate(ts['start'], existing['start'], schedule, show)
+                projected_ts = project(ts['start'], existing['start'])
                 create.append(projected_ts)
 
 
@@ -882,10 +946,10 @@ class Schedule(models.Model):
             #     - Change the start of the existing collision to projected end
             #
             if solution == 'ours-end':
-                projected_ts = TimeSlot.objects.instantiate(ts['start'], ts['end'], schedule, show)
+                projected_ts = project(ts['start'], ts['end'])
                 create.append(projected_ts)
 
-                existing_ts = TimeSlot.objects.get(pk=existing['id'])
+                existing_ts = existing_timeslots[existing['id']]
                 existing_ts.start = datetime.strptime(ts['end'], '%Y-%m-%d %H:%M:%S')
                 update.append(existing_ts)
 
@@ -896,7 +960,7 @@ class Schedule(models.Model):
             #     - Create projected with start time of existing end
             #
             if solution == 'theirs-start':
-                projected_ts = TimeSlot.objects.instantiate(existing['end'], ts['end'], schedule, show)
+                projected_ts = project(existing['end'], ts['end'])
                 create.append(projected_ts)
 
 
@@ -906,10 +970,10 @@ class Schedule(models.Model):
             #     - Change end of existing to projected start
             #
             if solution == 'ours-start':
-                projected_ts = TimeSlot.objects.instantiate(ts['start'], ts['end'], schedule, show)
+                projected_ts = project(ts['start'], ts['end'])
                 create.append(projected_ts)
 
-                existing_ts = TimeSlot.objects.get(pk=existing['id'])
+                existing_ts = existing_timeslots[existing['id']]
                 existing_ts.end = datetime.strptime(ts['start'], '%Y-%m-%d %H:%M:%S')
                 update.append(existing_ts)
 
@@ -920,10 +984,10 @@ class Schedule(models.Model):
             #     - Create two projected timeslots with end of existing start and start of existing end
             #
             if solution == 'theirs-both':
-                projected_ts = TimeSlot.objects.instantiate(ts['start'], existing['start'], schedule, show)
+                projected_ts = project(ts['start'], existing['start'])
                 create.append(projected_ts)
 
-                projected_ts = TimeSlot.objects.instantiate(existing['end'], ts['end'], schedule, show)
+                projected_ts = project(existing['end'], ts['end'])
                 create.append(projected_ts)
 
 
@@ -935,22 +999,20 @@ class Schedule(models.Model):
             #       - Create another one with start = projected end and end = existing end
             #
             if solution == 'ours-both':
-                projected_ts = TimeSlot.objects.instantiate(ts['start'], ts['end'], schedule, show)
+                projected_ts = project(ts['start'], ts['end'])
                 create.append(projected_ts)
 
-                existing_ts = TimeSlot.objects.get(pk=existing['id'])
+                existing_ts = existing_timeslots[existing['id']]
                 existing_ts.end = datetime.strptime(ts['start'], '%Y-%m-%d %H:%M:%S')
                 update.append(existing_ts)
 
-                projected_ts = TimeSlot.objects.instantiate(ts['end'], existing['end'], schedule, show)
+                projected_ts = project(ts['end'], existing['end'])
                 create.append(projected_ts)
 
 
         # If there were any errors, don't make any db changes yet
         # but add error messages and return already chosen solutions
         if len(errors) > 0:
-            conflicts = Schedule.make_conflicts(model_to_dict(schedule), schedule.pk, show.pk)
-
             partly_resolved = conflicts['projected']
             saved_solutions = {}
 
@@ -976,6 +1038,9 @@ class Schedule(models.Model):
             return conflicts
 
 
+        # Turn projected slots into timeslot objects
+        create = [TimeSlot.objects.instantiate(slot, schedule) for slot in create]
+
         # If 'dryrun' is true, just return the projected changes instead of executing them
         if 'dryrun' in sdl and sdl['dryrun']:
             output = {}
@@ -987,40 +1052,43 @@ class Schedule(models.Model):
 
         '''Database changes if no errors found'''
 
-        # Only save schedule if timeslots were created
-        if create:
-            # Create or update schedule
-            schedule.save()
+        with transaction.atomic():
+
+            # Only save schedule if timeslots were created
+            if create:
+                # Create or update schedule
+                schedule.save()
 
-            # Delete upcoming timeslots which still remain
-            TimeSlot.objects.filter(schedule=schedule, start__gt=schedule.until).delete()
+                # Delete upcoming timeslots which still remain
+                TimeSlot.objects.filter(schedule=schedule, start__gt=schedule.until).delete()
 
-        # Update timeslots
-        for ts in update:
-            ts.save(update_fields=["start", "end"])
+            # Update timeslots
+            TimeSlot.objects.bulk_update_times(update)
 
-        # Create timeslots
-        for ts in create:
-            ts.schedule = schedule
+            # Create timeslots
+            for ts in create:
+                ts.schedule = schedule
 
-            # Reassign playlists
-            if 'playlists' in data and ts.hash in data['playlists']:
-                ts.playlist_id = int(data['playlists'][ts.hash])
+                # Reassign playlists
+                if 'playlists' in data and ts.hash in data['playlists']:
+                    ts.playlist_id = int(data['playlists'][ts.hash])
 
-            ts.save()
+            TimeSlot.objects.bulk_create_timeslots(create)
 
             # Reassign notes
-            if 'notes' in data and ts.hash in data['notes']:
-                try:
-                    note = Note.objects.get(pk=int(data['notes'][ts.hash]))
-                    note.timeslot_id = ts.id
-                    note.save(update_fields=["timeslot_id"])
-                except ObjectDoesNotExist:
-                    pass
-
-        # Delete manually resolved timeslots
-        for dl in delete:
-            dl.delete()
+            if 'notes' in data:
+                relink = {int(data['notes'][ts.hash]): ts.id for ts in create if ts.hash in data['notes']}
+
+                if relink:
+                    Note.objects.filter(pk__in=relink.keys()).update(
+                        timeslot_id=Case(*[When(pk=note_id, then=Value(timeslot_id)) for note_id, timeslot_id in relink.items()],
+                                         output_field=models.IntegerField()))
+
+            # Delete manually resolved timeslots
+            TimeSlot.objects.filter(pk__in=[dl.pk for dl in delete]).delete()
+
+        # The session is used up
+        cache.delete('conflicts:%s' % conflicts['session'])
 
         return model_to_dict(schedule)
 
@@ -1032,24 +1100,92 @@ class Schedule(models.Model):
 
 class TimeSlotManager(models.Manager):
     @staticmethod
-    def instantiate(start, end, schedule, show):
-        return TimeSlot(start=datetime.strptime(start, '%Y-%m-%d %H:%M:%S'),
-                        end=datetime.strptime(end, '%Y-%m-%d %H:%M:%S'),
-                        show=show, is_repetition=schedule.is_repetition, schedule=schedule).generate()
+    def instantiate(slot, schedule):
+        """Returns an unsaved timeslot object for a projected slot"""
+
+        timeslot = TimeSlot(start=slot.start, end=slot.end, show=schedule.show,
+                            is_repetition=schedule.is_repetition, schedule=schedule)
+        timeslot.hash = slot.hash
+        return timeslot
+
+    @staticmethod
+    def bulk_create_timeslots(timeslots):
+        """
+        Inserts timeslot objects with as few queries as possible and sets their IDs
+        Expects to be called inside a transaction
+        """
+
+        if not timeslots:
+            return timeslots
+
+        for ts in timeslots:
+            ts.show = ts.schedule.show
+
+        if connection.features.can_return_ids_from_bulk_insert:
+            TimeSlot.objects.bulk_create(timeslots)
+        else:
+            # Rows are inserted in order, so new IDs can be matched by their position
+            last_id = TimeSlot.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+            TimeSlot.objects.bulk_create(timeslots)
+            ids = TimeSlot.objects.filter(id__gt=last_id, schedule__in=set(ts.schedule_id for ts in timeslots)).order_by('id').values_list('id', flat=True)
+
+            for ts, id in zip(timeslots, ids):
+                ts.id = id
+
+        TimeSlot.objects.sync_bulk_changes(timeslots)
+        return timeslots
+
+    @staticmethod
+    def bulk_update_times(timeslots):
+        """
+        Updates start and end of the given timeslot objects in a single query
+        The values need the output field to be converted like in save(), e.g. from local time to UTC
+        """
+
+        if not timeslots:
+            return timeslots
+
+        TimeSlot.objects.filter(pk__in=[ts.pk for ts in timeslots]).update(
+            start=Case(*[When(pk=ts.pk, then=Value(ts.start, output_field=models.DateTimeField())) for ts in timeslots], output_field=models.DateTimeField()),
+            end=Case(*[When(pk=ts.pk, then=Value(ts.end, output_field=models.DateTimeField())) for ts in timeslots], output_field=models.DateTimeField()))
+
+        TimeSlot.objects.sync_bulk_changes(timeslots)
+        return timeslots
+
+    @staticmethod
+    def sync_bulk_changes(timeslots):
+        """Updates the interval index, change log and program version after bulk writes, which don't send signals"""
+        intervals.index_timeslots(timeslots)
+        TimeSlotChange.objects.log([ts.id for ts in timeslots], TimeSlotChange.UPSERT)
+        bump_program_version()
+
+    @staticmethod
+    def get_window_timeslots(start, end):
+        """Returns timeslots touching [start, end], looked up through the interval index"""
+        return intervals.filter_overlapping(TimeSlot.objects.all(), start, end).filter(start__lte=end, end__gte=start)
+
+    @staticmethod
+    def get_overlapping_timeslots(start, end):
+        """Returns timeslots overlapping [start, end), looked up through the interval index"""
+        return intervals.filter_overlapping(TimeSlot.objects.all(), start, end).filter(Q(start__lte=start, end__gte=start) |
+                                                                                        Q(start__gt=start, start__lt=end)).exclude(end=start)
 
     @staticmethod
     def get_or_create_current():
+        now = datetime.now()
+        current = TimeSlot.objects.get_window_timeslots(now, now).filter(start__lte=now, end__gt=now)
+
         try:
-            return TimeSlot.objects.get(start__lte=datetime.now(), end__gt=datetime.now())
+            return current.get()
         except MultipleObjectsReturned:
-            return TimeSlot.objects.filter(start__lte=datetime.now(), end__gt=datetime.now())[0]
+            return current[0]
         except ObjectDoesNotExist:
             once = RRule.objects.get(pk=1)
             today = date.today().weekday()
             default = Show.objects.get(pk=1)
 
-            previous_timeslot = TimeSlot.objects.filter(end__lte=datetime.now()).order_by('-start')[0]
-            next_timeslot = TimeSlot.objects.filter(start__gte=datetime.now())[0]
+            previous_timeslot = TimeSlot.objects.filter(end__lte=now).order_by('-start')[0]
+            next_timeslot = TimeSlot.objects.filter(start__gte=now)[0]
 
             dstart, tstart = previous_timeslot.end.date(), previous_timeslot.end.time()
             until, tend = next_timeslot.start.date(), next_timeslot.start.time()
@@ -1070,20 +1206,45 @@ class TimeSlotManager(models.Manager):
             else:
                 return new_schedule.timeslots.all()[0]
 
+    @staticmethod
+    def fill_gaps(timeslots, start, end, default_show):
+        """
+        Returns the given timeslots ordered by start with unsaved timeslots of the default show filling the gaps in [start, end)
+        Takes a single pass and no queries. Filled timeslots have no id.
+        """
+
+        # Timeslots from the database are in UTC if USE_TZ is set
+        if settings.USE_TZ and timezone.is_naive(start):
+            start = timezone.make_aware(start).astimezone(timezone.utc)
+            end = timezone.make_aware(end).astimezone(timezone.utc)
+
+        filled = []
+        last_end = start
+
+        for timeslot in timeslots:
+            if timeslot.start > last_end:
+                filled.append(TimeSlot(start=last_end, end=timeslot.start, show=default_show))
+
+            filled.append(timeslot)
+            last_end = max(last_end, timeslot.end)
+
+        if last_end < end:
+            filled.append(TimeSlot(start=last_end, end=end, show=default_show))
+
+        return filled
+
     @staticmethod
     def get_day_timeslots(day):
         today = datetime.combine(day, time(6, 0))
         tomorrow = today + timedelta(days=1)
 
-        return TimeSlot.objects.filter(Q(start__lte=today, end__gte=today) |
-                                       Q(start__gt=today, start__lt=tomorrow)).exclude(end=today)
+        return TimeSlot.objects.get_overlapping_timeslots(today, tomorrow)
 
     @staticmethod
     def get_24h_timeslots(start):
         end = start + timedelta(hours=24)
 
-        return TimeSlot.objects.filter(Q(start__lte=start, end__gte=start) |
-                                       Q(start__gt=start, start__lt=end)).exclude(end=start)
+        return TimeSlot.objects.get_overlapping_timeslots(start, end)
 
 
     @staticmethod
@@ -1091,14 +1252,12 @@ class TimeSlotManager(models.Manager):
         start = datetime.combine(start, time(0, 0))
         end = start + timedelta(days=7)
 
-        return TimeSlot.objects.filter(Q(start__lte=start, end__gte=start) |
-                                       Q(start__gt=start, start__lt=end)).exclude(end=start)
+        return TimeSlot.objects.get_overlapping_timeslots(start, end)
 
 
     @staticmethod
     def get_timerange_timeslots(start, end):
-        return TimeSlot.objects.filter(Q(start__lte=start, end__gte=start) |
-                                       Q(start__gt=start, start__lt=end)).exclude(end=start)
+        return TimeSlot.objects.get_overlapping_timeslots(start, end)
 
 
 class TimeSlot(models.Model):
@@ -1114,6 +1273,11 @@ class TimeSlot(models.Model):
 
     class Meta:
         ordering = ('start', 'end')
+        indexes = [
+            models.Index(fields=['start', 'end']),
+            models.Index(fields=['end', 'start']),
+            models.Index(fields=['start', 'id']),
+        ]
         verbose_name = _("Time slot")
         verbose_name_plural = _("Time slots")
 
@@ -1135,15 +1299,171 @@ class TimeSlot(models.Model):
         self.show = self.schedule.show
 
         # Generate a distinct and reproducible hash for the timeslot
-        # Makes sure none of these fields changed when updating a schedule
-        string = str(self.start) + str(self.end) + str(self.schedule.rrule.id) + str(self.schedule.byweekday)
-        self.hash = str(''.join(s for s in string if s.isdigit()))
+        self.hash = recurrence.get_hash(self.start, self.end, self.schedule.rrule.id, self.schedule.byweekday)
         return self
 
     def get_absolute_url(self):
         return reverse('timeslot-detail', args=[str(self.id)])
 
 
+class TimeSlotChangeManager(models.Manager):
+    @staticmethod
+    def log(timeslot_ids, action):
+        """Logs a change for each of the given timeslot IDs, to be called by bulk paths which don't send signals"""
+        TimeSlotChange.objects.bulk_create([TimeSlotChange(timeslot_id=timeslot_id, action=action) for timeslot_id in timeslot_ids])
+
+    @staticmethod
+    def log_shows(show_ids):
+        """Logs upserts of the upcoming timeslots of the given shows, since their playout entries contain show data"""
+        timeslot_ids = TimeSlot.objects.filter(show__in=show_ids, end__gt=timezone.now()).values_list('id', flat=True)
+        TimeSlotChange.objects.log(list(timeslot_ids), TimeSlotChange.UPSERT)
+
+    @staticmethod
+    def get_latest_version():
+        latest = TimeSlotChange.objects.order_by('-id').values_list('id', flat=True).first()
+        return latest if latest != None else 0
+
+    @staticmethod
+    def get_settled_version():
+        """
+        Returns the latest version logged more than PLAYOUT_CHANGES_SETTLE seconds ago
+        IDs are assigned on insert but visible on commit, so a lower ID may still show up after a higher one.
+        Syncing from this version sends recent changes again instead of skipping them.
+        """
+
+        horizon = timezone.now() - timedelta(seconds=getattr(settings, 'PLAYOUT_CHANGES_SETTLE', 60))
+        settled = TimeSlotChange.objects.filter(created__lte=horizon).order_by('-id').values_list('id', flat=True).first()
+        return settled if settled != None else 0
+
+    @staticmethod
+    def get_first_version():
+        """Returns the oldest version changes can be synced from, older ones were pruned"""
+        first = TimeSlotChange.objects.order_by('id').values_list('id', flat=True).first()
+        return first - 1 if first != None else 0
+
+    @staticmethod
+    def prune(days):
+        """Deletes changes logged more than the given number of days ago except the latest, returns their number"""
+
+        horizon = timezone.now() - timedelta(days=days)
+        latest = TimeSlotChange.objects.get_latest_version()
+        return TimeSlotChange.objects.filter(created__lt=horizon, id__lt=latest).delete()[0]
+
+    @staticmethod
+    def get_changes_since(version):
+        """
+        Returns a tuple of IDs of upserted and deleted timeslots since the given version
+        Only the last change of each timeslot counts
+        """
+
+        actions = {}
+
+        for timeslot_id, action in TimeSlotChange.objects.filter(id__gt=version).order_by('id').values_list('timeslot_id', 'action'):
+            actions[timeslot_id] = action
+
+        upserted = [timeslot_id for timeslot_id, action in actions.items() if action == TimeSlotChange.UPSERT]
+        deleted = [timeslot_id for timeslot_id, action in actions.items() if action == TimeSlotChange.DELETE]
+
+        return upserted, deleted
+
+
+class TimeSlotChange(models.Model):
+    """Log of created, updated and deleted timeslots, its IDs serve as versions for incremental syncs"""
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+
+    ACTION_CHOICES = (
+        (UPSERT, _("Created or updated")),
+        (DELETE, _("Deleted")),
+    )
+
+    timeslot_id = models.IntegerField(_("Time slot ID"))
+    action = models.CharField(_("Action"), max_length=6, choices=ACTION_CHOICES)
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+
+    objects = TimeSlotChangeManager()
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = _("Time slot change")
+        verbose_name_plural = _("Time slot changes")
+
+    def __str__(self):
+        return '%d: %s %s' % (self.id, self.action, self.timeslot_id)
+
+
+class ProgramVersion(models.Model):
+    """Single row holding the global program version, see program.version"""
+
+    version = models.BigIntegerField(_("Version"))
+
+    class Meta:
+        verbose_name = _("Program version")
+        verbose_name_plural = _("Program versions")
+
+    def __str__(self):
+        return '%d' % self.version
+
+
+@receiver(post_save, sender=TimeSlot)
+def timeslot_saved(sender, instance, using, **kwargs):
+    """Keeps the interval index in sync with saved timeslots and logs the change"""
+    intervals.index_timeslots([instance], using)
+    TimeSlotChange.objects.log([instance.id], TimeSlotChange.UPSERT)
+
+
+@receiver(post_delete, sender=TimeSlot)
+def timeslot_deleted(sender, instance, using, **kwargs):
+    """Removes deleted timeslots from the interval index and logs the change"""
+    intervals.unindex([instance.id], using)
+    TimeSlotChange.objects.log([instance.id], TimeSlotChange.DELETE)
+
+
+# Fields of shows whose related objects are contained in playout entries
+SHOW_RELATIONS = {Host: 'hosts', Category: 'category', Topic: 'topic', MusicFocus: 'musicfocus', Language: 'language', Type: 'type', RTRCategory: 'rtrcategory'}
+
+
+def show_saved(sender, instance, raw=False, **kwargs):
+    """Logs the upcoming timeslots of a saved show as changed"""
+    if not raw:
+        TimeSlotChange.objects.log_shows([instance.pk])
+
+
+def show_relation_changed(sender, instance, raw=False, **kwargs):
+    """Logs the upcoming timeslots of the shows of a saved or deleted host, category, etc. as changed"""
+    if not raw:
+        TimeSlotChange.objects.log_shows(Show.objects.filter(**{SHOW_RELATIONS[sender]: instance}).values_list('id', flat=True))
+
+
+def show_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Logs the upcoming timeslots of shows as changed if their hosts, categories, etc. changed"""
+
+    if action == 'pre_clear' and reverse:
+        instance._show_ids = list(sender.objects.filter(**{type(instance)._meta.model_name: instance.pk}).values_list('show_id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            TimeSlotChange.objects.log_shows([instance.pk])
+        elif action == 'post_clear':
+            TimeSlotChange.objects.log_shows(getattr(instance, '_show_ids', []))
+        else:
+            TimeSlotChange.objects.log_shows(pk_set)
+
+
+post_save.connect(show_saved, sender=Show)
+
+for model, field in SHOW_RELATIONS.items():
+    post_save.connect(show_relation_changed, sender=model)
+
+    if field in ('type', 'rtrcategory'):
+        # Shows are deleted along with them
+        continue
+
+    # Links to shows are gone after the delete
+    pre_delete.connect(show_relation_changed, sender=model)
+    m2m_changed.connect(show_relations_changed, sender=getattr(Show, field).through)
+
+
 class Note(models.Model):
     STATUS_CHOICES = (
         (0, _("Cancellation")),
@@ -1159,6 +1479,7 @@ class Note(models.Model):
     height = models.PositiveIntegerField('Image Height', blank=True, null=True, editable=False)
     width = models.PositiveIntegerField('Image Width', blank=True, null=True,editable=False)
     image = VersatileImageField(_("Featured image"), blank=True, null=True, upload_to='note_images', width_field='width', height_field='height', ppoi_field='ppoi', help_text=_("Upload an image to your show. Images are automatically cropped around the 'Primary Point of Interest'. Click in the image to change it and press Save."))
+    thumbnails = models.TextField(_("Thumbnails"), blank=True, editable=False)
     status = models.IntegerField(_("Status"), choices=STATUS_CHOICES, default=1)
     start = models.DateTimeField(editable=False)
     show = models.ForeignKey(Show, related_name='notes', editable=True)
@@ -1171,6 +1492,10 @@ class Note(models.Model):
 
     class Meta:
         ordering = ('timeslot',)
+        indexes = [
+            models.Index(fields=['start', 'id']),
+            models.Index(fields=['created', 'id']),
+        ]
         verbose_name = _("Note")
         verbose_name_plural = _("Notes")
 
@@ -1190,31 +1515,15 @@ class Note(models.Model):
     def get_audio_url(cba_id):
         """
         Retrieve the direct URL to the mp3 in CBA
-        In order to retrieve the URL, stations need
-           - to be whitelisted by CBA
-           - an API Key
-
-        Therefore contact cba@fro.at
+        Blocks until CBA responded unless the URL is cached, see program.cba for resolving it in the background
         """
 
-        from pv.settings import CBA_AJAX_URL, CBA_API_KEY
-
-        audio_url = ''
-
-        if cba_id != None and cba_id != '' and CBA_API_KEY != '':
-            from urllib.request import urlopen
-            import json
-
-            url = CBA_AJAX_URL + '?action=cba_ajax_get_filename&post_id=' + str(cba_id) + '&api_key=' + CBA_API_KEY
+        from . import cba
 
-            # For momentary testing without being whitelisted - TODO: delete the line
-            url = 'https://cba.fro.at/wp-content/plugins/cba/ajax/cba-get-filename.php?post_id=' + str(cba_id) + '&c=Ml3fASkfwR8'
+        if cba_id == None or cba_id == '':
+            return ''
 
-            with urlopen(url) as conn:
-                audio_url_json = conn.read().decode('utf-8-sig')
-                audio_url = json.loads(audio_url_json)
-
-        return audio_url
+        return cba.resolve([int(cba_id)]).get(int(cba_id), '')
 
 
     def save(self, *args, **kwargs):
@@ -1223,7 +1532,130 @@ class Note(models.Model):
 
         super(Note, self).save(*args, **kwargs)
 
-        # Generate thumbnails
-        if self.image.name and THUMBNAIL_SIZES:
-            for size in THUMBNAIL_SIZES:
-                thumbnail = self.image.crop[size].name
+
+class CBAAudio(models.Model):
+    """Cache of direct audio URLs of CBA posts, failed lookups are cached as well"""
+
+    cba_id = models.IntegerField(_("CBA ID"), primary_key=True)
+    audio_url = models.TextField(_("Direct URL to a linked audio file"), blank=True)
+    failed = models.BooleanField(_("Failed"), default=False)
+    fetched = models.DateTimeField(_("Fetched"))
+
+    class Meta:
+        ordering = ('cba_id',)
+        verbose_name = _("CBA audio URL")
+        verbose_name_plural = _("CBA audio URLs")
+
+    def __str__(self):
+        return '%d: %s' % (self.cba_id, self.audio_url)
+
+
+class ThumbnailJobManager(models.Manager):
+    @staticmethod
+    def enqueue(instance):
+        """Queues rendering the thumbnails of a host, show or note, see program.thumbnails"""
+
+        if instance.image.name and THUMBNAIL_SIZES:
+            ThumbnailJob.objects.create(model=instance._meta.label, object_id=instance.pk)
+        elif instance.thumbnails:
+            type(instance).objects.filter(pk=instance.pk).update(thumbnails='')
+            instance.thumbnails = ''
+
+
+class ThumbnailJob(models.Model):
+    """Pending thumbnail rendering of an image, processed by the process_thumbnail_jobs command"""
+
+    model = models.CharField(_("Model"), max_length=64)
+    object_id = models.IntegerField(_("Object ID"))
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+
+    objects = ThumbnailJobManager()
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = _("Thumbnail job")
+        verbose_name_plural = _("Thumbnail jobs")
+
+
+def image_saving(sender, instance, raw=False, **kwargs):
+    """Remembers the image and its PPOI of a host, show or note before it is saved"""
+    if not raw and instance.pk != None:
+        instance._previous_image = sender.objects.filter(pk=instance.pk).values_list('image', 'ppoi').first()
+
+
+def image_saved(sender, instance, raw, **kwargs):
+    """
+    Queues rendering the thumbnails of saved hosts, shows and notes instead of rendering them in the request
+    Only if their image or PPOI changed or the thumbnails weren't rendered yet
+    """
+
+    if raw:
+        return
+
+    previous = getattr(instance, '_previous_image', None)
+    image = (instance.image.name or '', instance.ppoi)
+
+    if previous is None or (previous[0] or '', previous[1]) != image or (image[0] and not instance.thumbnails):
+        ThumbnailJob.objects.enqueue(instance)
+
+
+for model in (Host, Show, Note):
+    pre_save.connect(image_saving, sender=model)
+    post_save.connect(image_saved, sender=model)
+
+
+def schedule_saving(sender, instance, raw=False, **kwargs):
+    """Remembers the show of a schedule before it is saved, since it may be moved to another show"""
+    if not raw and instance.pk != None:
+        instance._previous_show_id = Schedule.objects.filter(pk=instance.pk).values_list('show_id', flat=True).first()
+
+
+def schedule_changed(sender, instance, raw=False, **kwargs):
+    """Updates the date the show of a saved or deleted schedule, a previous show and their hosts are active until"""
+    if not raw:
+        Show.update_active_until(set([instance.show_id, getattr(instance, '_previous_show_id', None)]) - set([None]))
+
+
+def show_deleting(sender, instance, **kwargs):
+    """Remembers the hosts of a show before it is deleted"""
+    instance._host_ids = list(instance.hosts.values_list('id', flat=True))
+
+
+def show_deleted(sender, instance, **kwargs):
+    """Updates the date the former hosts of a deleted show are active until"""
+    Host.update_active_until(getattr(instance, '_host_ids', []))
+
+
+def hosts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Updates the date hosts are active until if they were added to or removed from shows"""
+
+    if reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Host.update_active_until([instance.pk])
+    elif action == 'pre_clear':
+        instance._host_ids = list(instance.hosts.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        Host.update_active_until(pk_set)
+    elif action == 'post_clear':
+        Host.update_active_until(getattr(instance, '_host_ids', []))
+
+
+pre_save.connect(schedule_saving, sender=Schedule)
+post_save.connect(schedule_changed, sender=Schedule)
+post_delete.connect(schedule_changed, sender=Schedule)
+pre_delete.connect(show_deleting, sender=Show)
+post_delete.connect(show_deleted, sender=Show)
+m2m_changed.connect(hosts_changed, sender=Show.hosts.through)
+
+
+def program_changed(sender, **kwargs):
+    """Bumps the program version whenever schedules, timeslots, shows, notes or anything listed with them change"""
+    bump_program_version()
+
+
+for model in (Type, Category, Topic, MusicFocus, RTRCategory, Language, Host, Schedule, TimeSlot, Show, Note):
+    post_save.connect(program_changed, sender=model)
+    post_delete.connect(program_changed, sender=model)
+
+for through in (Show.hosts.through, Show.category.through, Show.topic.through, Show.musicfocus.through, Show.language.through):
+    m2m_changed.connect(program_changed, sender=through)
@@ -0,0 +1,220 @@
+"""
+Keyset pagination for the REST API
+
+Pages are requested with GET variable 'limit' and continued with the opaque cursor of the
+'next' or 'previous' link, which holds the ordering values of the last or first item. Pages are
+looked up by comparing these values instead of skipping rows with OFFSET and no count is taken
+unless 'count=approximate' is given. Without 'limit' or 'cursor' results aren't paginated.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import F, Q
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates querysets by a unique ordering of (field, 'id')
+    Subclasses may return another field for a request, e.g. to order by creation
+    """
+
+    field = 'id'
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    count_query_param = 'count'
+    default_limit = 100
+    max_limit = 1000
+
+    def get_field(self, request, view=None):
+        return self.field
+
+    def get_ordering(self):
+        if self.field == 'id':
+            return ('id',)
+        return (self.field, 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.limit_query_param not in request.query_params and self.cursor_query_param not in request.query_params:
+            return None
+
+        self.request = request
+        self.field = self.get_field(request, view)
+        self.limit = self.get_limit(request)
+        cursor = self.decode_cursor(request)
+
+        self.count = self.get_approximate_count(queryset) if request.query_params.get(self.count_query_param) == 'approximate' else None
+
+        ordering = self.get_ordering()
+        reverse = cursor != None and cursor['reverse']
+
+        if reverse:
+            queryset = queryset.order_by(*('-' + field for field in ordering))
+        else:
+            queryset = queryset.order_by(*ordering)
+
+        if cursor != None:
+            queryset = queryset.filter(self.get_position_filter(cursor['position'], reverse))
+
+        queryset = queryset.annotate(keyset_position=F(self.field))
+
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor != None
+
+        self.results = results
+        return results
+
+    def get_position_filter(self, position, reverse):
+        """Returns the filter of items after the given position, or before it if reversed"""
+
+        value, pk = position
+        lookup = 'lt' if reverse else 'gt'
+
+        if self.field == 'id':
+            return Q(**{'id__' + lookup: pk})
+
+        return Q(**{self.field + '__' + lookup: value}) | Q(**{self.field: value, 'id__' + lookup: pk})
+
+    def get_position(self, item):
+        value = item.keyset_position
+        return [value.isoformat() if hasattr(value, 'isoformat') else value, item.pk]
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(request.query_params[self.limit_query_param], strict=True, cutoff=self.max_limit)
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if encoded is None:
+            return None
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            value, pk = cursor['position']
+            cursor['position'] = (value, int(pk))
+            cursor['reverse'] = bool(cursor['reverse'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(_("Invalid cursor"))
+
+        return cursor
+
+    def encode_cursor(self, position, reverse):
+        data = json.dumps({'position': position, 'reverse': reverse}, separators=(',', ':'))
+        encoded = urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.get_position(self.results[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.results:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.get_position(self.results[0]), True)
+
+    def get_approximate_count(self, queryset):
+        """
+        Returns the number of rows the database expects the queryset to return
+        Only PostgreSQL and MySQL estimate them without scanning, other databases count exactly
+        """
+
+        connection = connections[queryset.db]
+        queryset = queryset.order_by()
+
+        if connection.vendor == 'postgresql':
+            return self.get_postgresql_estimate(queryset, connection)
+
+        if connection.vendor == 'mysql':
+            return self.get_mysql_estimate(queryset, connection)
+
+        return queryset.count()
+
+    def get_postgresql_estimate(self, queryset, connection):
+        sql, params = queryset.query.sql_with_params()
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def get_mysql_estimate(self, queryset, connection):
+        """
+        Returns the row count of the table statistics for unfiltered querysets, otherwise the
+        rows MySQL expects to read from the tables of the outermost SELECT of its plan, reduced
+        by their expected share of rows matching the conditions
+        """
+
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+
+                if row != None and row[0] != None:
+                    return int(row[0])
+
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute('EXPLAIN ' + sql, params)
+            columns = [column[0].lower() for column in cursor.description]
+            plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        estimate = 1.0
+
+        for row in plan:
+            if row['id'] == plan[0]['id']:
+                # 'filtered' is missing in older versions, NULL rows mean nothing matches
+                filtered = row.get('filtered')
+                estimate *= float(row['rows'] or 0) * (float(filtered) if filtered != None else 100) / 100
+
+        return int(round(estimate))
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+
+        if self.count != None:
+            response['count'] = self.count
+
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+
+        return Response(response)
+
+
+class TimeSlotPagination(KeysetPagination):
+    """Pages timeslots by (start, id)"""
+
+    field = 'start'
+
+
+class NotePagination(KeysetPagination):
+    """Pages notes by (start, id), or by (created, id) with GET variable 'order=created'"""
+
+    field = 'start'
+
+    def get_field(self, request, view=None):
+        return 'created' if request.query_params.get('order') == 'created' else 'start'
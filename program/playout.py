@@ -0,0 +1,152 @@
+import json
+from datetime import timedelta
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import quote_etag
+from django.utils.translation import ugettext_lazy as _
+
+from program.models import Show, TimeSlot, TimeSlotChange
+from program.version import get_program_version
+
+
+def get_show_infos(show_ids):
+    """
+    Returns joined names of hosts, categories, topics, music focus and languages per show ID
+    Uses one query per relation regardless of the number of shows
+    """
+
+    relations = (
+        ('hosts', Show.hosts.through, 'host__name'),
+        ('categories', Show.category.through, 'category__category'),
+        ('topics', Show.topic.through, 'topic__topic'),
+        ('musicfocus', Show.musicfocus.through, 'musicfocus__focus'),
+        ('languages', Show.language.through, 'language__name'),
+    )
+
+    names = {show_id: {key: [] for key, through, field in relations} for show_id in show_ids}
+
+    for key, through, field in relations:
+        for show_id, name in through.objects.filter(show_id__in=show_ids).order_by(field).values_list('show_id', field):
+            names[show_id][key].append(name)
+
+    return {show_id: {key: ', '.join(values) for key, values in infos.items()} for show_id, infos in names.items()}
+
+
+def get_playout_entries(timeslots, fill=None):
+    """
+    Returns a list of playout entries for the given timeslots
+    Takes a fixed number of queries: one for the timeslots and one per show relation
+
+    If fill is a (start, end) tuple, gaps in between are filled with entries of the default show
+    """
+
+    timeslots = list(timeslots.select_related('schedule', 'show', 'show__type', 'show__rtrcategory').order_by('start'))
+
+    if fill != None:
+        default_show = Show.objects.select_related('type', 'rtrcategory').get(pk=1)
+        timeslots = TimeSlot.objects.fill_gaps(timeslots, fill[0], fill[1], default_show)
+
+    infos = get_show_infos(set(ts.show_id for ts in timeslots))
+
+    return [get_playout_entry(ts, infos[ts.show_id]) for ts in timeslots]
+
+
+def get_playout_entry(ts, infos):
+    """
+    Returns the playout entry of a timeslot given the joined names of its show
+    Timeslots filling gaps have neither an ID nor a schedule
+    """
+
+    schedule = ts.schedule if ts.schedule_id != None else None
+    is_repetition = ' ' + _('REP') if schedule != None and schedule.is_repetition is 1 else ''
+
+    classname = 'default'
+
+    if ts.playlist_id is None or ts.playlist_id == 0:
+        classname = 'danger'
+
+    entry = {
+        'id': ts.id,
+        'start': ts.start.strftime('%Y-%m-%dT%H:%M:%S'),
+        'end': ts.end.strftime('%Y-%m-%dT%H:%M:%S'),
+        'title': ts.show.name + is_repetition, # For JS Calendar
+        'automation-id': -1,
+        'schedule_id': schedule.id if schedule != None else None,
+        'is_repetition': ts.is_repetition,
+        'playlist_id': ts.playlist_id,
+        'schedule_fallback_id': schedule.fallback_id if schedule != None else None, # The schedule's fallback
+        'show_fallback_id': ts.show.fallback_id, # The show's fallback
+        'show_id': ts.show.id,
+        'show_name': ts.show.name + is_repetition,
+        'show_hosts': infos['hosts'],
+        'show_type': ts.show.type.type,
+        'show_categories': infos['categories'],
+        'show_topics': infos['topics'],
+        'show_musicfocus': infos['musicfocus'],
+        'show_languages': infos['languages'],
+        'show_rtrcategory': ts.show.rtrcategory.rtrcategory,
+        'station_fallback_id': 0, # TODO: The station's global fallback (might change)
+        'memo': ts.memo,
+        'className': classname,
+    }
+
+    if schedule != None and schedule.automation_id:
+        entry['automation-id'] = schedule.automation_id
+
+    return entry
+
+
+def get_playout_snapshot(start, end=None, fill=False):
+    """
+    Returns a tuple of the ETag and the serialized playout JSON for the given timerange
+    If end is None, the 7 days following start are returned
+    If fill is set, gaps are filled with entries of the default show
+
+    Snapshots are tagged with the program version and rebuilt only after the program changed
+    """
+
+    key = 'playout:%s:%s:%s%s' % (get_program_version(), start.isoformat(), end.isoformat() if end else '7d', ':fill' if fill else '')
+    snapshot = cache.get(key)
+
+    if snapshot is None:
+        if end is None:
+            timeslots = TimeSlot.objects.get_7d_timeslots(start)
+            window = (start, start + timedelta(days=7))
+        else:
+            timeslots = TimeSlot.objects.get_timerange_timeslots(start, end)
+            window = (start, end)
+
+        content = json.dumps(get_playout_entries(timeslots, window if fill else None), ensure_ascii=False).encode('utf8')
+        snapshot = (quote_etag(sha1(content).hexdigest()), content)
+
+        cache.set(key, snapshot, getattr(settings, 'PLAYOUT_SNAPSHOT_TIMEOUT', 60 * 60 * 24))
+
+    return snapshot
+
+
+def get_playout_changes(since):
+    """
+    Returns timeslots created, updated and deleted since the given version
+    Upserted timeslots are returned as playout entries, deleted ones as IDs
+
+    The returned version is the settled one, so changes of the last PLAYOUT_CHANGES_SETTLE seconds
+    are sent again with the next sync. Applying them again has no effect.
+    """
+
+    version = TimeSlotChange.objects.get_settled_version()
+    upserted, deleted = TimeSlotChange.objects.get_changes_since(since)
+
+    entries = get_playout_entries(TimeSlot.objects.filter(id__in=upserted).order_by('start'))
+
+    # Timeslots updated and deleted afterwards without being logged yet are gone as well
+    existing = set(entry['id'] for entry in entries)
+    deleted = sorted(set(deleted) | set(upserted) - existing)
+
+    return {
+        'since': since,
+        'version': version,
+        'upserted': entries,
+        'deleted': deleted,
+    }
@@ -0,0 +1,156 @@
+"""
+Recurrence engine for schedules
+
+Expands the start datetimes of a schedule's recurrence rule once and derives the ends by
+adding the duration of a single timeslot, so timeslots over midnight end on the following day.
+Expansions are memoized per process, since the same schedules are expanded again and again
+while conflicts are previewed and resolved.
+"""
+
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from dateutil.rrule import rrule
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+# Maximum number of memoized expansions
+CACHE_SIZE = 512
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def get_hash(start, end, rrule_id, byweekday):
+    """
+    Returns a distinct and reproducible hash for a timeslot
+    Makes sure none of these fields changed when updating a schedule
+    """
+    string = str(start) + str(end) + str(rrule_id) + str(byweekday)
+    return str(''.join(s for s in string if s.isdigit()))
+
+
+def to_timestamp(dt):
+    """Returns the seconds since epoch of a naive local datetime, ignoring DST"""
+    return (dt - EPOCH) // timedelta(seconds=1)
+
+
+def from_timestamp(timestamp):
+    """Returns the naive local datetime of seconds since epoch"""
+    return EPOCH + timedelta(seconds=timestamp)
+
+
+class ProjectedSlot(object):
+    """
+    A timeslot generated from a schedule but not stored yet
+    Keeps start and end as seconds since epoch of the local time and the timeslot hash
+    """
+
+    __slots__ = ('start_ts', 'end_ts', 'hash', '_key')
+
+    def __init__(self, start_ts, end_ts, slot_hash):
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+        self.hash = slot_hash
+        self._key = hash((start_ts, end_ts, slot_hash))
+
+    @classmethod
+    def create(cls, start, end, rrule_id, byweekday):
+        """Returns a slot for naive local datetimes"""
+        return cls(to_timestamp(start), to_timestamp(end), get_hash(start, end, rrule_id, byweekday))
+
+    @classmethod
+    def parse(cls, start, end, rrule_id, byweekday):
+        """Returns a slot for datetime strings as used in conflicts, e.g. '2018-01-01 10:00:00'"""
+
+        start, end = parse_datetime(str(start)), parse_datetime(str(end))
+
+        # Collisions are timezone-aware if USE_TZ is set
+        if timezone.is_aware(start):
+            start = timezone.make_naive(start)
+        if timezone.is_aware(end):
+            end = timezone.make_naive(end)
+
+        return cls.create(start, end, rrule_id, byweekday)
+
+    @property
+    def start(self):
+        return from_timestamp(self.start_ts)
+
+    @property
+    def end(self):
+        return from_timestamp(self.end_ts)
+
+    def __eq__(self, other):
+        return (isinstance(other, ProjectedSlot) and self.start_ts == other.start_ts and
+                self.end_ts == other.end_ts and self.hash == other.hash)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return self._key
+
+    def __repr__(self):
+        return '<ProjectedSlot: %s - %s>' % (self.start, self.end)
+
+
+def expand_schedule(schedule):
+    """Returns a tuple of projected slots for a schedule instance, starting from dstart"""
+
+    rule = schedule.rrule
+    return expand(rule.pk, rule.freq, rule.interval, rule.bysetpos, int(schedule.byweekday),
+                  schedule.dstart, schedule.tstart, schedule.tend, schedule.until)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def expand(rrule_id, freq, interval, bysetpos, byweekday, dstart, tstart, tend, until):
+    """
+    Returns a tuple of projected slots for the given recurrence
+    Results are shared between callers and must not be modified
+    """
+
+    byweekno = None
+    weekdays = byweekday
+    first = datetime.combine(dstart, tstart)
+    last = datetime.combine(until + timedelta(days=+1), time())
+
+    # Timeslots over midnight end the next day
+    if tend < tstart:
+        duration = datetime.combine(dstart + timedelta(days=+1), tend) - first
+    else:
+        duration = datetime.combine(dstart, tend) - first
+
+    if freq == 0: # One-time timeslots
+        starts = [first]
+    else:
+        if freq == 3 and rrule_id == 2: # Daily timeslots
+            weekdays = (0, 1, 2, 3, 4, 5, 6)
+        elif freq == 3 and rrule_id == 3: # Business days MO - FR
+            weekdays = (0, 1, 2, 3, 4)
+        elif freq == 2 and rrule_id == 7: # Even calendar weeks
+            byweekno = list(range(2, 54, 2))
+        elif freq == 2 and rrule_id == 8: # Odd calendar weeks
+            byweekno = list(range(1, 54, 2))
+
+        starts = rrule(freq=freq,
+                       dtstart=first,
+                       interval=interval,
+                       until=last,
+                       bysetpos=bysetpos,
+                       byweekday=weekdays,
+                       byweekno=byweekno)
+
+    slots = []
+
+    for start in starts:
+        end = start + duration
+
+        # Timeslots must end by the day after until, one-time timeslots are always created
+        if end > last and freq != 0:
+            break
+
+        slots.append(ProjectedSlot.create(start, end, rrule_id, byweekday))
+
+    return tuple(slots)
+
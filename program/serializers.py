@@ -1,15 +1,59 @@
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import User, Group
-from rest_framework import serializers, status
+from rest_framework import permissions, serializers, status
 from rest_framework.response import Response
+from program import cba
+from program.thumbnails import get_thumbnails
 from program.models import Show, Schedule, TimeSlot, Category, RTRCategory, Host, Language, Topic, MusicFocus, Note, Type, Language, RRule
 from profile.models import Profile
 from profile.serializers import ProfileSerializer
 from datetime import datetime
 
-from pv.settings import THUMBNAIL_SIZES
 
-class UserSerializer(serializers.ModelSerializer):
+def get_requested_fields(request, names):
+    """Returns the field names out of the given ones requested by GET variables 'fields' and 'omit'"""
+
+    names = list(names)
+
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return names
+
+    if request.query_params.get('fields'):
+        requested = set(request.query_params.get('fields').split(','))
+        names = [name for name in names if name in requested]
+
+    if request.query_params.get('omit'):
+        omitted = set(request.query_params.get('omit').split(','))
+        names = [name for name in names if name not in omitted]
+
+    return names
+
+
+class SparseFieldsMixin(object):
+    """
+    Leaves out fields not requested by GET variables 'fields' and 'omit', e.g. ?fields=id,name,slug or ?omit=content
+    Fields left out are neither computed nor queried. Only applies to reads and not to nested serializers.
+    """
+
+    def get_fields(self):
+        fields = super(SparseFieldsMixin, self).get_fields()
+
+        # The serializer of the response or of the items of a list response
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+
+        if parent != None:
+            return fields
+
+        requested = set(get_requested_fields(self.context.get('request'), fields))
+
+        for name in list(fields):
+            if name not in requested:
+                del fields[name]
+
+        return fields
+
+
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     # Add profile fields to JSON
     profile = ProfileSerializer()
 
@@ -69,7 +113,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
@@ -90,18 +134,12 @@ class CategorySerializer(serializers.ModelSerializer):
         return instance
 
 
-class HostSerializer(serializers.ModelSerializer):
+class HostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     thumbnails = serializers.SerializerMethodField() # Read-only
 
     def get_thumbnails(self, host):
-        """Returns thumbnails"""
-        thumbnails = []
-
-        if host.image.name and THUMBNAIL_SIZES:
-            for size in THUMBNAIL_SIZES:
-                thumbnails.append(host.image.crop[size].name)
-
-        return thumbnails
+        """Returns thumbnails rendered by the thumbnail worker"""
+        return get_thumbnails(host)
 
     class Meta:
         model = Host
@@ -131,7 +169,7 @@ class HostSerializer(serializers.ModelSerializer):
         return instance
 
 
-class LanguageSerializer(serializers.ModelSerializer):
+class LanguageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Language
         fields = '__all__'
@@ -148,7 +186,7 @@ class LanguageSerializer(serializers.ModelSerializer):
         return instance
 
 
-class TopicSerializer(serializers.ModelSerializer):
+class TopicSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Topic
         fields = '__all__'
@@ -167,7 +205,7 @@ class TopicSerializer(serializers.ModelSerializer):
         return instance
 
 
-class MusicFocusSerializer(serializers.ModelSerializer):
+class MusicFocusSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MusicFocus
         fields = '__all__'
@@ -186,7 +224,7 @@ class MusicFocusSerializer(serializers.ModelSerializer):
         return instance
 
 
-class TypeSerializer(serializers.ModelSerializer):
+class TypeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Type
         fields = '__all__'
@@ -206,7 +244,7 @@ class TypeSerializer(serializers.ModelSerializer):
         return instance
 
 
-class RTRCategorySerializer(serializers.ModelSerializer):
+class RTRCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = RTRCategory
         fields = '__all__'
@@ -225,7 +263,7 @@ class RTRCategorySerializer(serializers.ModelSerializer):
         return instance
 
 
-class ShowSerializer(serializers.HyperlinkedModelSerializer):
+class ShowSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     owners = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(),many=True)
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(),many=True)
     hosts = serializers.PrimaryKeyRelatedField(queryset=Host.objects.all(),many=True)
@@ -236,15 +274,12 @@ class ShowSerializer(serializers.HyperlinkedModelSerializer):
     rtrcategory = serializers.PrimaryKeyRelatedField(queryset=RTRCategory.objects.all())
     thumbnails = serializers.SerializerMethodField() # Read-only
 
-    def get_thumbnails(self, show):
-        """Returns thumbnails"""
-        thumbnails = []
-
-        if show.image.name and THUMBNAIL_SIZES:
-            for size in THUMBNAIL_SIZES:
-                thumbnails.append(show.image.crop[size].name)
+    # Relations to prefetch if their fields are serialized
+    prefetched_fields = ('owners', 'category', 'hosts', 'language', 'topic', 'musicfocus')
 
-        return thumbnails
+    def get_thumbnails(self, show):
+        """Returns thumbnails rendered by the thumbnail worker"""
+        return get_thumbnails(show)
 
 
     class Meta:
@@ -314,7 +349,7 @@ class ShowSerializer(serializers.HyperlinkedModelSerializer):
         return instance
 
 
-class ScheduleSerializer(serializers.ModelSerializer):
+class ScheduleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     rrule = serializers.PrimaryKeyRelatedField(queryset=RRule.objects.all())
     show = serializers.PrimaryKeyRelatedField(queryset=Show.objects.all())
 
@@ -354,7 +389,7 @@ class ScheduleSerializer(serializers.ModelSerializer):
         return instance
 
 
-class TimeSlotSerializer(serializers.ModelSerializer):
+class TimeSlotSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     show = serializers.PrimaryKeyRelatedField(queryset=Show.objects.all())
     schedule = serializers.PrimaryKeyRelatedField(queryset=Schedule.objects.all())
 
@@ -378,21 +413,15 @@ class TimeSlotSerializer(serializers.ModelSerializer):
         return instance
 
 
-class NoteSerializer(serializers.ModelSerializer):
+class NoteSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     show = serializers.PrimaryKeyRelatedField(queryset=Show.objects.all())
     timeslot = serializers.PrimaryKeyRelatedField(queryset=TimeSlot.objects.all())
     host = serializers.PrimaryKeyRelatedField(queryset=Host.objects.all())
     thumbnails = serializers.SerializerMethodField() # Read-only
 
     def get_thumbnails(self, note):
-        """Returns thumbnails"""
-        thumbnails = []
-
-        if note.image.name and THUMBNAIL_SIZES:
-            for size in THUMBNAIL_SIZES:
-                thumbnails.append(note.image.crop[size].name)
-
-        return thumbnails
+        """Returns thumbnails rendered by the thumbnail worker"""
+        return get_thumbnails(note)
 
 
     class Meta:
@@ -406,10 +435,12 @@ class NoteSerializer(serializers.ModelSerializer):
         # Save the creator
         validated_data['user_id'] = self.context['user_id']
 
-        # Try to retrieve audio URL from CBA
-        validated_data['audio_url'] = Note.get_audio_url(validated_data['cba_id'])
+        note = Note.objects.create(**validated_data)
+
+        # Retrieve audio URL from CBA without waiting for it
+        cba.resolve_note(note)
 
-        return Note.objects.create(**validated_data)
+        return note
 
 
     def update(self, instance, validated_data):
@@ -424,8 +455,15 @@ class NoteSerializer(serializers.ModelSerializer):
         instance.image = validated_data.get('image', instance.image)
         instance.status = validated_data.get('status', instance.status)
         instance.host = validated_data.get('host', instance.host)
-        instance.cba_id = validated_data.get('cba_id', instance.cba_id)
-        instance.audio_url = Note.get_audio_url(instance.cba_id)
+
+        # Drop the audio URL of a previously linked post
+        if validated_data.get('cba_id', instance.cba_id) != instance.cba_id:
+            instance.cba_id = validated_data.get('cba_id')
+            instance.audio_url = ''
 
         instance.save()
+
+        # Retrieve audio URL from CBA without waiting for it
+        cba.resolve_note(instance)
+
         return instance
\ No newline at end of file
@@ -2,6 +2,8 @@ from django import template
 
 from datetime import datetime, time, timedelta
 
+from program.utils import to_naive
+
 register = template.Library()
 
 
@@ -23,3 +25,11 @@ def duration_since(start):
     else:
         end = datetime.combine(start.date(), time(6, 0))
     return 'style="height: %dpx"' % ((end-start).seconds/60)
+
+
+@register.simple_tag
+def duration_within(start, end, day):
+    """Returns the height of a timeslot cut off at the broadcast day (06:00 - 06:00) it's shown in"""
+    first = datetime.combine(day, time(6, 0))
+    last = first + timedelta(days=1)
+    return duration(max(to_naive(start), first), min(to_naive(end), last))
@@ -0,0 +1,895 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time as clock
+from datetime import date, datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+
+from program import caching, cba, intervals, recurrence, thumbnails, week
+from program.admin import ScheduleAdmin
+from program.forms import automation_id_formfield
+from program.pagination import KeysetPagination
+from program.serializers import get_requested_fields
+from program.utils import get_automation_id_choices, to_naive
+from program.version import bump_program_version, get_program_version
+from program.timeline import Timeline
+from program.models import CBAAudio, Category, Host, Language, MusicFocus, Note, RRule, Schedule, Show, ThumbnailJob, TimeSlot, TimeSlotChange, Topic
+
+
+class ProgramTestCase(TestCase):
+    fixtures = ['rrules', 'types', 'rtrcategories', 'categories', 'topics', 'musicfocus', 'languages', 'hosts', 'shows']
+
+    def create_show(self, name):
+        show = Show.objects.create(name=name, slug=name.lower(), type_id=3, rtrcategory_id=1, short_description=name)
+        show.hosts.set(Host.objects.all()[:1])
+        show.category.set(Category.objects.all()[:2])
+        show.topic.set(Topic.objects.all()[:1])
+        show.musicfocus.set(MusicFocus.objects.all()[:1])
+        show.language.set(Language.objects.all()[:2])
+        return show
+
+    def create_schedule(self, rrule=1, dstart=date(2026, 11, 5), tstart=time(10, 0), tend=time(11, 0), until=None, show=None):
+        return Schedule.objects.create(rrule=RRule.objects.get(pk=rrule), byweekday=dstart.weekday(), show=show or Show.objects.get(pk=1),
+                                       dstart=dstart, tstart=tstart, tend=tend, until=until or dstart)
+
+    def commit(self):
+        """Runs the callbacks of transaction.on_commit, since test transactions are never committed"""
+
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+
+        for sids, func in callbacks:
+            func()
+
+    def create_timeslot(self, schedule, start, end):
+        return TimeSlot(schedule=schedule, start=start, end=end).save()
+
+    def create_timeslots(self, schedule):
+        timeslots = [TimeSlot.objects.instantiate(slot, schedule) for slot in Schedule.generate_timeslots(schedule)]
+        return TimeSlot.objects.bulk_create_timeslots(timeslots)
+
+
+class BulkUpdateTimesTest(ProgramTestCase):
+    def test_converts_like_save(self):
+        schedule = self.create_schedule()
+        saved = self.create_timeslot(schedule, datetime(2026, 11, 5, 20, 0), datetime(2026, 11, 5, 21, 0))
+        updated = self.create_timeslot(schedule, datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 11, 0))
+
+        updated.start, updated.end = datetime(2026, 11, 5, 20, 0), datetime(2026, 11, 5, 21, 0)
+        TimeSlot.objects.bulk_update_times([updated])
+
+        saved.refresh_from_db()
+        updated.refresh_from_db()
+        self.assertEqual((updated.start, updated.end), (saved.start, saved.end))
+
+
+class ProgramVersionTest(ProgramTestCase):
+    def test_shared_between_processes(self):
+        self.commit()
+        version = get_program_version()
+        bump_program_version()
+        self.commit()
+
+        # Another process has its own cache but reads the same version
+        cache.clear()
+        self.assertEqual(get_program_version(), version + 1)
+
+    def test_bumped_on_commit(self):
+        self.commit()
+        version = get_program_version()
+
+        with transaction.atomic():
+            schedule = self.create_schedule()
+            self.create_timeslots(schedule)
+
+            # Concurrent requests must not tag the old program with a new version
+            self.assertEqual(get_program_version(), version)
+
+        self.commit()
+        self.assertEqual(get_program_version(), version + 1)
+
+
+class RecurrenceTest(ProgramTestCase):
+    def test_one_time_over_midnight(self):
+        slots = recurrence.expand(1, 0, 1, None, 3, date(2026, 11, 5), time(23, 0), time(1, 0), date(2026, 11, 5))
+        self.assertEqual([(slot.start, slot.end) for slot in slots], [(datetime(2026, 11, 5, 23, 0), datetime(2026, 11, 6, 1, 0))])
+
+    def test_recurring_over_midnight(self):
+        # Like before, the last timeslot must end by the day after until
+        slots = recurrence.expand(2, 3, 1, None, 3, date(2026, 11, 5), time(23, 0), time(1, 0), date(2026, 11, 7))
+        self.assertEqual([slot.start for slot in slots], [datetime(2026, 11, 5, 23, 0), datetime(2026, 11, 6, 23, 0)])
+
+
+class IntervalIndexTest(ProgramTestCase):
+    def setUp(self):
+        if not intervals.is_available():
+            self.skipTest('No R*Tree index on this database')
+
+        self.schedule = self.create_schedule(rrule=4, until=date(2026, 12, 31))
+
+    def assertIndexed(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, start_ts, end_ts FROM %s' % intervals.RTREE_TABLE)
+            indexed = {pk: (start, end) for pk, start, end in cursor.fetchall()}
+
+        stored = {pk: (intervals.to_epoch(start), intervals.to_epoch(end)) for pk, start, end in TimeSlot.objects.values_list('id', 'start', 'end')}
+        self.assertEqual(set(indexed), set(stored))
+
+        # Bounds are stored as 32-bit floats rounded outwards
+        for pk, (start, end) in stored.items():
+            self.assertTrue(start - 256 < indexed[pk][0] <= start <= end <= indexed[pk][1] < end + 256)
+
+    def test_save_and_delete(self):
+        timeslot = self.create_timeslot(self.schedule, datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 11, 0))
+        self.create_timeslot(self.schedule, datetime(2026, 11, 12, 10, 0), datetime(2026, 11, 12, 11, 0))
+        self.assertIndexed()
+
+        timeslot.end = datetime(2026, 11, 5, 12, 0)
+        timeslot.save()
+        self.assertIndexed()
+
+        timeslot.delete()
+        self.assertIndexed()
+
+        TimeSlot.objects.all().delete()
+        self.assertIndexed()
+
+    def test_bulk_paths(self):
+        timeslots = self.create_timeslots(self.schedule)
+        self.assertIndexed()
+
+        for timeslot in timeslots:
+            timeslot.start += timedelta(hours=1)
+            timeslot.end += timedelta(hours=2)
+
+        TimeSlot.objects.bulk_update_times(timeslots)
+        self.assertIndexed()
+
+    def test_lookups(self):
+        self.create_timeslot(self.schedule, datetime(2026, 11, 5, 8, 0), datetime(2026, 11, 5, 9, 0))
+        first = self.create_timeslot(self.schedule, datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 11, 0))
+        second = self.create_timeslot(self.schedule, datetime(2026, 11, 5, 11, 0), datetime(2026, 11, 5, 12, 0))
+        self.create_timeslot(self.schedule, datetime(2026, 11, 5, 13, 0), datetime(2026, 11, 5, 14, 0))
+
+        overlapping = TimeSlot.objects.get_overlapping_timeslots(datetime(2026, 11, 5, 10, 30), datetime(2026, 11, 5, 11, 30))
+        self.assertEqual(list(overlapping), [first, second])
+
+        # The index lookup also works in subqueries
+        shows = Show.objects.filter(pk__in=overlapping.values('show'))
+        self.assertEqual(list(shows), [self.schedule.show])
+
+
+class PlayoutQueriesTest(ProgramTestCase):
+    def setUp(self):
+        cache.clear()
+        get_program_version()
+
+        for i, tstart in enumerate((time(8, 0), time(12, 0), time(18, 0))):
+            schedule = self.create_schedule(rrule=2, tstart=tstart, tend=time(tstart.hour + 2, 0), until=date(2026, 12, 31),
+                                            show=self.create_show('Show%d' % i))
+            self.create_timeslots(schedule)
+
+    def test_constant_queries(self):
+        for fill in ('', '&fill=default'):
+            with CaptureQueriesContext(connection) as day:
+                response = self.client.get('/api/v1/playout?start=2026-11-10&end=2026-11-10' + fill)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len([entry for entry in response.json() if entry['id'] != None]), 3)
+
+            # Four weeks of timeslots take as many queries as a single day
+            with self.assertNumQueries(len(day)):
+                response = self.client.get('/api/v1/playout?start=2026-11-10&end=2026-12-07' + fill)
+
+            self.assertEqual(len([entry for entry in response.json() if entry['id'] != None]), 3 * 28)
+
+
+class PlayoutSnapshotTest(ProgramTestCase):
+    def test_etags(self):
+        cache.clear()
+        show = self.create_show('Snapshot')
+        self.create_timeslot(self.create_schedule(show=show), datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 11, 0))
+        self.commit()
+
+        response = self.client.get('/api/v1/playout?start=2026-11-05&end=2026-11-05')
+        etag = response['ETag']
+
+        # Only the program version is read
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/playout?start=2026-11-05&end=2026-11-05', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+        show.name = 'Renamed'
+        show.save()
+        self.commit()
+
+        response = self.client.get('/api/v1/playout?start=2026-11-05&end=2026-11-05', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['show_name'], 'Renamed')
+
+
+class FrappTest(ProgramTestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_timeslots(self.create_schedule(rrule=2, dstart=date(2026, 11, 10), tstart=time(8, 0), tend=time(10, 0),
+                                                   until=date(2026, 11, 20), show=self.create_show('Daily')))
+
+        for hour in (12, 18):
+            schedule = self.create_schedule(dstart=date(2026, 11, 12), tstart=time(hour, 0), tend=time(hour + 2, 0), show=self.create_show('Once%d' % hour))
+            timeslot = self.create_timeslots(schedule)[0]
+            Note.objects.create(timeslot=timeslot, title='Note%d' % hour, slug='note%d' % hour, content='Note', user=User.objects.get_or_create(username='frapp')[0])
+
+        self.commit()
+
+        # The current site is cached after the first lookup
+        Site.objects.get_current()
+
+    def test_constant_queries(self):
+        with CaptureQueriesContext(connection) as single:
+            response = self.client.get('/api/frapp/?date=2026-11-11').json()
+
+        self.assertEqual(len(response['shows']), 1)
+        cache.clear()
+
+        with self.assertNumQueries(len(single)):
+            response = self.client.get('/api/frapp/?date=2026-11-12').json()
+
+        self.assertEqual([show['namedisplay'] for show in response['shows']], ['Daily', 'Note12', 'Note18'])
+        self.assertEqual([series['namedisplay'] for series in response['series']], ['Daily', 'Once12', 'Once18'])
+
+    def test_cached_until_changed(self):
+        self.client.get('/api/frapp/?date=2026-11-12')
+
+        # Only the program version is read
+        with self.assertNumQueries(1):
+            self.client.get('/api/frapp/?date=2026-11-12')
+
+        Show.objects.get(name='Daily').delete()
+        self.commit()
+
+        response = self.client.get('/api/frapp/?date=2026-11-12').json()
+        self.assertEqual([show['namedisplay'] for show in response['shows']], ['Note12', 'Note18'])
+
+
+@override_settings(PLAYOUT_CHANGES_SETTLE=0)
+class ConflictSessionTest(ProgramTestCase):
+    def setUp(self):
+        cache.clear()
+        self.day = date.today() + timedelta(days=14)
+        self.existing = self.create_timeslot(self.create_schedule(dstart=self.day), datetime.combine(self.day, time(10, 0)), datetime.combine(self.day, time(11, 0)))
+        self.show = self.create_show('Conflicting')
+        self.sdl = {'rrule': 4, 'byweekday': self.day.weekday(), 'dstart': self.day.isoformat(), 'tstart': '10:30', 'tend': '11:30',
+                    'until': (self.day + timedelta(days=14)).isoformat(), 'is_repetition': 'false', 'fallback_id': '', 'automation_id': ''}
+
+    def submit(self):
+        conflicts = Schedule.make_conflicts(self.sdl, None, self.show.pk)
+        self.collision = [ts for ts in conflicts['projected'] if ts['collisions']][0]
+
+        return {'schedule': self.sdl, 'solutions': {self.collision['hash']: ''}, 'notes': {}, 'playlists': {},
+                'session': conflicts['session'], 'stamp': conflicts['stamp']}
+
+    def test_reused_session(self):
+        data = self.submit()
+
+        # Neither a partial nor the final resolution generate the conflicts again
+        with mock.patch.object(Schedule, 'generate_conflicts', side_effect=AssertionError('Conflicts generated again')):
+            conflicts = Schedule.resolve_conflicts(data, None, self.show.pk)
+            self.assertEqual(conflicts['projected'][0]['error'], 'No solution given.')
+
+            data['solutions'][self.collision['hash']] = 'ours'
+            schedule = Schedule.resolve_conflicts(data, None, self.show.pk)
+
+        self.assertEqual(TimeSlot.objects.filter(schedule=schedule['id']).count(), 3)
+        self.assertFalse(TimeSlot.objects.filter(pk=self.existing.pk).exists())
+        self.assertEqual(cache.get('conflicts:%s' % data['session']), None)
+
+    def test_stale_session(self):
+        generate_conflicts = Schedule.generate_conflicts
+
+        for change in ('collision', 'window', 'schedule', 'unrelated'):
+            data = self.submit()
+
+            if change == 'collision':
+                self.existing.end = datetime.combine(self.day, time(11, 30))
+                self.existing.save()
+            elif change == 'window':
+                self.create_timeslot(self.existing.schedule, datetime.combine(self.day + timedelta(days=7), time(10, 0)), datetime.combine(self.day + timedelta(days=7), time(11, 0)))
+            elif change == 'schedule':
+                data['schedule'] = dict(self.sdl, tend='11:15')
+            else:
+                self.create_timeslot(self.existing.schedule, datetime.combine(self.day + timedelta(days=60), time(10, 0)), datetime.combine(self.day + timedelta(days=60), time(11, 0)))
+
+            with mock.patch.object(Schedule, 'generate_conflicts', side_effect=generate_conflicts) as generated:
+                Schedule.resolve_conflicts(data, None, self.show.pk)
+
+            self.assertEqual(generated.called, change != 'unrelated', change)
+
+
+class ChangeFeedTest(ProgramTestCase):
+    def setUp(self):
+        self.show = self.create_show('Changed')
+        self.schedule = self.create_schedule(rrule=4, dstart=date.today() + timedelta(days=7), until=date.today() + timedelta(days=35), show=self.show)
+        self.timeslot_ids = sorted(ts.id for ts in self.create_timeslots(self.schedule))
+
+    def get_upserted(self, since):
+        upserted, deleted = TimeSlotChange.objects.get_changes_since(since)
+        return sorted(upserted)
+
+    def test_show_data_changes(self):
+        version = TimeSlotChange.objects.get_latest_version()
+        self.show.name = 'Renamed'
+        self.show.save()
+        self.assertEqual(self.get_upserted(version), self.timeslot_ids)
+
+        version = TimeSlotChange.objects.get_latest_version()
+        host = self.show.hosts.get()
+        host.name = 'Renamed'
+        host.save()
+        self.assertEqual(self.get_upserted(version), self.timeslot_ids)
+
+        version = TimeSlotChange.objects.get_latest_version()
+        self.show.category.clear()
+        self.assertEqual(self.get_upserted(version), self.timeslot_ids)
+
+        version = TimeSlotChange.objects.get_latest_version()
+        host.delete()
+        self.assertEqual(self.get_upserted(version), self.timeslot_ids)
+
+    def test_recent_changes_are_sent_again(self):
+        response = self.client.get('/api/v1/playout/changes?since=0').json()
+        self.assertEqual(sorted(entry['id'] for entry in response['upserted']), self.timeslot_ids)
+
+        # Changes within PLAYOUT_CHANGES_SETTLE seconds may still be followed by lower IDs
+        self.assertLess(response['version'], TimeSlotChange.objects.get_latest_version())
+
+        with override_settings(PLAYOUT_CHANGES_SETTLE=0):
+            self.assertEqual(TimeSlotChange.objects.get_settled_version(), TimeSlotChange.objects.get_latest_version())
+
+    def test_pruned_versions(self):
+        version = TimeSlotChange.objects.get_latest_version()
+        TimeSlotChange.objects.update(created=timezone.now() - timedelta(days=40))
+
+        self.assertGreater(TimeSlotChange.objects.prune(30), 0)
+        self.assertEqual(TimeSlotChange.objects.get_first_version(), version - 1)
+
+        response = self.client.get('/api/v1/playout/changes?since=0')
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.json()['version'], version)
+        self.assertEqual(self.client.get('/api/v1/playout/changes?since=%d' % (version - 1)).status_code, 200)
+
+
+class TimelineTest(ProgramTestCase):
+    def test_overlapping_timeslots(self):
+        schedule = self.create_schedule()
+        outer = self.create_timeslot(schedule, datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 14, 0))
+        nested = self.create_timeslot(schedule, datetime(2026, 11, 5, 11, 0), datetime(2026, 11, 5, 12, 0))
+        overlapping = self.create_timeslot(schedule, datetime(2026, 11, 5, 13, 0), datetime(2026, 11, 5, 15, 0))
+
+        timeline = Timeline.build(date(2026, 11, 5), 0)
+        entries = [(entry.start.hour, entry.end.hour, entry.timeslot_id) for entry in timeline.entries if not entry.is_virtual]
+
+        self.assertEqual(entries, [(10, 11, outer.id), (11, 12, nested.id), (12, 13, outer.id), (13, 15, overlapping.id)])
+
+        # No holes between entries
+        for previous, entry in zip(timeline.entries, timeline.entries[1:]):
+            self.assertEqual(previous.end, entry.start)
+
+        self.assertEqual(timeline.current(datetime(2026, 11, 5, 12, 30)).timeslot_id, outer.id)
+
+
+class BoundaryCacheTest(ProgramTestCase):
+    def setUp(self):
+        cache.clear()
+        now = datetime.now().replace(second=0, microsecond=0)
+        self.create_timeslot(self.create_schedule(), now - timedelta(minutes=10), now + timedelta(minutes=10))
+        self.commit()
+
+        self.calls = 0
+        self.factory = RequestFactory()
+
+    def view(self, request):
+        self.calls += 1
+        return HttpResponse(str(self.calls), status=int(request.GET.get('status', 200)))
+
+    def get(self, path='/current', max_timeout=None):
+        return caching.cache_until_boundary(max_timeout)(self.view)(self.factory.get(path))
+
+    def get_max_age(self, response):
+        return int(response['Cache-Control'].split('max-age=')[1])
+
+    def test_cached_until_boundary(self):
+        response = self.get()
+        self.assertEqual(response.content, b'1')
+        self.assertTrue(0 < self.get_max_age(response) <= 10 * 60 + 1)
+
+        self.assertEqual(self.get().content, b'1')
+        self.assertEqual(self.get('/current?other').content, b'2')
+
+        # A changed program is never answered from the cache
+        bump_program_version()
+        self.commit()
+        self.assertEqual(self.get().content, b'3')
+
+    def test_max_timeout(self):
+        self.assertEqual(self.get_max_age(self.get(max_timeout=5)), 5)
+
+        with override_settings(BOUNDARY_CACHE_TIMEOUT=120):
+            self.assertEqual(self.get_max_age(self.get()), 120)
+
+    def test_uncached(self):
+        self.assertEqual(self.get('/current?status=404').content, b'1')
+        self.assertEqual(self.get('/current?status=404').content, b'2')
+
+        response = caching.cache_until_boundary()(self.view)(self.factory.post('/current'))
+        self.assertEqual(response.content, b'3')
+        self.assertFalse(response.has_header('Cache-Control'))
+
+
+class DayScheduleTest(ProgramTestCase):
+    def setUp(self):
+        talk, music = self.create_show('Talk'), self.create_show('Music')
+        Show.objects.filter(pk=talk.pk).update(type_id=1)
+
+        self.talk = self.create_timeslot(self.create_schedule(show=talk), datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 11, 0))
+        self.music = self.create_timeslot(self.create_schedule(show=music), datetime(2026, 11, 5, 11, 0), datetime(2026, 11, 5, 12, 0))
+
+    def test_filled_gaps(self):
+        timeslots = self.client.get('/program/2026/11/5/').context['timeslots']
+
+        self.assertEqual([ts.id for ts in timeslots], [None, self.talk.id, self.music.id, None])
+        self.assertEqual((timeslots[0].start, timeslots[-1].end), (timezone.make_aware(datetime(2026, 11, 5, 6, 0)), timezone.make_aware(datetime(2026, 11, 6, 6, 0))))
+
+    def test_filtered(self):
+        # The default show doesn't fill the place of filtered out timeslots
+        timeslots = self.client.get('/program/2026/11/5/?type=talk').context['timeslots']
+        self.assertEqual([ts.id for ts in timeslots], [self.talk.id])
+
+
+class WeekGridTest(ProgramTestCase):
+    def setUp(self):
+        cache.clear()
+        schedule = self.create_schedule(show=self.create_show('Night'))
+        self.night = self.create_timeslot(schedule, datetime(2026, 11, 3, 5, 0), datetime(2026, 11, 3, 7, 0))
+        self.evening = self.create_timeslot(schedule, datetime(2026, 11, 5, 20, 0), datetime(2026, 11, 5, 21, 0))
+        self.commit()
+
+    def test_grid(self):
+        with self.assertNumQueries(2):
+            grid = week.get_week_grid(date(2026, 11, 2))
+
+        self.assertEqual([day['date'] for day in grid], [date(2026, 11, 2) + timedelta(days=i) for i in range(7)])
+
+        # Timeslots over 06:00 show up on both broadcast days
+        timeslot_ids = [[ts.id for ts in day['timeslots'] if ts.id != None] for day in grid]
+        self.assertEqual(timeslot_ids, [[self.night.id], [self.night.id], [], [self.evening.id], [], [], []])
+
+        # Each broadcast day is covered from 06:00 to 06:00 without holes
+        for day in grid:
+            start = datetime.combine(day['date'], time(6, 0))
+            self.assertLessEqual(to_naive(day['timeslots'][0].start), start)
+            self.assertGreaterEqual(to_naive(day['timeslots'][-1].end), start + timedelta(days=1))
+
+            for previous, timeslot in zip(day['timeslots'], day['timeslots'][1:]):
+                self.assertEqual(to_naive(previous.end), to_naive(timeslot.start))
+
+    def test_cached_until_changed(self):
+        content = week.render_week_grid(date(2026, 11, 2))
+
+        # Only the program version is read
+        with self.assertNumQueries(1):
+            self.assertEqual(week.render_week_grid(date(2026, 11, 2)), content)
+
+        Show.objects.filter(name='Night').update(name='Renamed')
+        self.evening.save()
+        self.commit()
+
+        self.assertIn('Renamed', week.render_week_grid(date(2026, 11, 2)))
+
+
+class KeysetPaginationTest(ProgramTestCase):
+    def setUp(self):
+        schedule = self.create_schedule()
+
+        # Timeslots starting at the same time are ordered by ID
+        for hour in (10, 10, 10, 11, 11):
+            self.create_timeslot(schedule, datetime(2026, 11, 5, hour, 0), datetime(2026, 11, 5, hour + 1, 0))
+
+        self.ids = list(TimeSlot.objects.order_by('start', 'id').values_list('id', flat=True))
+
+    def test_ties(self):
+        response = self.client.get('/api/v1/timeslots/?start=2026-11-05&end=2026-11-05&limit=2&count=approximate').json()
+        self.assertEqual(response['count'], 5)
+        self.assertEqual(response['previous'], None)
+
+        pages = [[timeslot['id'] for timeslot in response['results']]]
+
+        while response['next'] != None:
+            response = self.client.get(response['next']).json()
+            self.assertEqual(response['count'], 5)
+            pages.append([timeslot['id'] for timeslot in response['results']])
+
+        self.assertEqual(pages, [self.ids[0:2], self.ids[2:4], self.ids[4:]])
+
+        # And back again
+        response = self.client.get(response['previous']).json()
+        self.assertEqual([timeslot['id'] for timeslot in response['results']], self.ids[2:4])
+        response = self.client.get(response['previous']).json()
+        self.assertEqual([timeslot['id'] for timeslot in response['results']], self.ids[0:2])
+
+    def test_mysql_estimate(self):
+        class Cursor(object):
+            description = [('id',), ('table',), ('rows',), ('filtered',)]
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def execute(self, sql, params):
+                self.sql = sql
+
+            def fetchall(self):
+                # Timeslots joined with their show, and a subquery of another SELECT
+                return [(1, 'program_timeslot', 400, 25.0), (1, 'program_show', 1, 100.0), (2, 'program_note', 1000, 10.0)]
+
+        class Connection(object):
+            def cursor(self):
+                return Cursor()
+
+        queryset = TimeSlot.objects.filter(start__gte=datetime(2026, 11, 5)).select_related('show')
+        self.assertEqual(KeysetPagination().get_mysql_estimate(queryset, Connection()), 100)
+
+
+class SparseFieldsTest(ProgramTestCase):
+    def setUp(self):
+        self.show = self.create_show('Sparse')
+        self.create_timeslot(self.create_schedule(show=self.show), datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 11, 0))
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as full:
+            shows = self.client.get('/api/v1/shows/').json()
+
+        self.assertIn('hosts', shows[0])
+
+        # Relations which aren't requested aren't queried, only the shows and their number
+        with self.assertNumQueries(2):
+            shows = self.client.get('/api/v1/shows/?fields=id,name,unknown').json()
+
+        self.assertLess(2, len(full))
+        self.assertEqual([set(show) for show in shows], [{'id', 'name'}] * len(shows))
+
+        show = self.client.get('/api/v1/shows/%d/?fields=id,slug' % self.show.pk).json()
+        self.assertEqual(show, {'id': self.show.pk, 'slug': 'sparse'})
+
+        timeslots = self.client.get('/api/v1/timeslots/?start=2026-11-05&end=2026-11-05&fields=id,start').json()
+        self.assertEqual([set(timeslot) for timeslot in timeslots], [{'id', 'start'}])
+
+    def test_omit(self):
+        show = self.client.get('/api/v1/shows/%d/?omit=description,hosts,thumbnails' % self.show.pk).json()
+
+        self.assertTrue({'id', 'name', 'category'} <= set(show))
+        self.assertFalse({'description', 'hosts', 'thumbnails'} & set(show))
+
+    def test_writes(self):
+        # Writes always see all fields
+        request = Request(RequestFactory().post('/api/v1/shows/?fields=id'))
+        self.assertEqual(get_requested_fields(request, ['id', 'name']), ['id', 'name'])
+
+
+class ShowListQueriesTest(ProgramTestCase):
+    def create_shows(self, count):
+        for i in range(Show.objects.count(), Show.objects.count() + count):
+            self.create_show('Show%d' % i)
+
+    def test_constant_queries(self):
+        for query in ('', '?fields=id,name,hosts,category', '?omit=owners,language'):
+            Show.objects.exclude(pk=1).delete()
+            self.create_shows(10)
+
+            with CaptureQueriesContext(connection) as few:
+                response = self.client.get('/api/v1/shows/' + query)
+
+            self.assertEqual(len(response.json()), 11)
+            self.create_shows(40)
+
+            # Five times the shows take as many queries
+            with self.assertNumQueries(len(few)):
+                response = self.client.get('/api/v1/shows/' + query)
+
+            self.assertEqual(len(response.json()), 51)
+
+
+class ActiveShowsTest(ProgramTestCase):
+    def test_active_api_filter(self):
+        today = date.today()
+        running = self.create_schedule(rrule=4, dstart=today - timedelta(days=7), until=today + timedelta(days=7), show=self.create_show('Running'))
+        self.create_schedule(rrule=4, dstart=today + timedelta(days=7), until=today + timedelta(days=35), show=self.create_show('Upcoming'))
+        self.create_schedule(rrule=4, dstart=today - timedelta(days=35), until=today - timedelta(days=7), show=self.create_show('Ended'))
+        once = self.create_schedule(rrule=1, dstart=today + timedelta(days=3), show=self.create_show('Once'))
+
+        # Currently running shows, upcoming single timeslots count as well
+        response = self.client.get('/api/v1/shows/?active=true&fields=id')
+        self.assertEqual(sorted(show['id'] for show in response.json()), sorted([running.show_id, once.show_id]))
+
+    def test_moved_schedule(self):
+        old_show, new_show = self.create_show('Old'), self.create_show('New')
+        schedule = self.create_schedule(rrule=4, until=date(2026, 12, 31), show=old_show)
+        self.assertEqual(Show.objects.get(pk=old_show.pk).active_until, date(2026, 12, 31))
+
+        schedule.show = new_show
+        schedule.save()
+
+        self.assertEqual(Show.objects.get(pk=old_show.pk).active_until, None)
+        self.assertEqual(Show.objects.get(pk=new_show.pk).active_until, date(2026, 12, 31))
+
+    def test_renewed_schedule(self):
+        show = self.create_show('Renewed')
+        schedule = self.create_schedule(rrule=4, dstart=date.today() - timedelta(days=35), until=date.today() - timedelta(days=7), show=show)
+        host = show.hosts.get()
+
+        # ScheduleAdmin isn't registered, so the action is called directly
+        request = RequestFactory().post('/')
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        ScheduleAdmin(Schedule, admin.site).renew(request, Schedule.objects.filter(pk=schedule.pk))
+
+        until = date(date.today().year + 1, 12, 31)
+        self.assertEqual(Schedule.objects.get(pk=schedule.pk).until, until)
+        self.assertEqual(Show.objects.get(pk=show.pk).active_until, until)
+        self.assertEqual(Host.objects.get(pk=host.pk).active_until, until)
+
+
+def start_server(handler):
+    """Serves requests with the given handler on a free port of localhost in a background thread"""
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class CBAStubHandler(BaseHTTPRequestHandler):
+    """Answers requests for audio URLs like CBA depending on the post ID"""
+
+    requests = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        post_id = int(query['post_id'][0])
+        self.requests.append(post_id)
+
+        if query['api_key'] != ['secret']:
+            self.send_response(403)
+        elif post_id == 2:
+            self.send_response(500)
+        elif post_id == 3:
+            clock.sleep(1)
+            self.send_response(200)
+        else:
+            self.send_response(200)
+
+        self.end_headers()
+        self.wfile.write(json.dumps('https://cba.example/%d.mp3' % post_id).encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CBATest(ProgramTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(CBATest, cls).setUpClass()
+        cls.server = start_server(CBAStubHandler)
+
+        cls.settings = override_settings(CBA_AJAX_URL='http://127.0.0.1:%d/wp-admin/admin-ajax.php' % cls.server.server_port,
+                                         CBA_API_KEY='secret', CBA_TIMEOUT=0.2, CBA_RESOLVE_IN_BACKGROUND=False)
+        cls.settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(CBATest, cls).tearDownClass()
+
+    def setUp(self):
+        del CBAStubHandler.requests[:]
+        schedule = self.create_schedule()
+        self.timeslot = self.create_timeslot(schedule, datetime(2026, 11, 5, 10, 0), datetime(2026, 11, 5, 11, 0))
+        self.user = User.objects.create_user('cba')
+
+    def create_note(self, cba_id):
+        note = Note.objects.create(timeslot=self.timeslot, title='Note', slug='note', content='Note', user=self.user, cba_id=cba_id)
+        cba.resolve_note(note)
+        return note
+
+    def test_resolved_note(self):
+        note = self.create_note(1)
+
+        self.assertEqual(note.audio_url, 'https://cba.example/1.mp3')
+        self.assertEqual(CBAAudio.objects.get(cba_id=1).audio_url, 'https://cba.example/1.mp3')
+        self.assertEqual(self.client.get('/api/v1/notes/%d/' % note.pk).json()['audio_url'], 'https://cba.example/1.mp3')
+
+        # Further lookups are answered from the cache table
+        self.assertEqual(Note.get_audio_url(1), 'https://cba.example/1.mp3')
+        self.assertEqual(CBAAudio.objects.count(), 1)
+        self.assertEqual(CBAStubHandler.requests, [1])
+
+    def test_failed_requests(self):
+        for cba_id, error in ((2, 'HTTP Error 500'), (3, 'timed out')):
+            with self.assertLogs('program.cba', 'WARNING') as logs:
+                note = self.create_note(cba_id)
+
+            self.assertIn(error, logs.output[0])
+
+            self.assertEqual(note.audio_url, '')
+            self.assertTrue(CBAAudio.objects.get(cba_id=cba_id).failed)
+            self.assertEqual(self.client.get('/api/v1/notes/%d/' % note.pk).json()['audio_url'], '')
+            note.delete()
+
+        # Failed lookups aren't requested again until they are stale
+        self.assertEqual(cba.resolve([2, 3]), {})
+        self.assertEqual(CBAStubHandler.requests, [2, 3])
+
+    def test_keeps_last_url(self):
+        CBAAudio.objects.create(cba_id=2, audio_url='https://cba.example/old.mp3', fetched=timezone.now() - timedelta(days=2))
+
+        with self.assertLogs('program.cba', 'WARNING'):
+            self.assertEqual(cba.resolve([2]), {2: 'https://cba.example/old.mp3'})
+
+        self.assertTrue(CBAAudio.objects.get(cba_id=2).failed)
+
+
+class AutomationStubHandler(BaseHTTPRequestHandler):
+    """Answers with the shows of the automation"""
+
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(json.dumps({'shows': [{'id': 2, 'title': 'Zebra'}, {'id': 1, 'title': 'aardvark'}],
+                                     'multi-shows': [{'id': 3, 'title': 'Mixed'}]}).encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AutomationShowsTest(ProgramTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(AutomationShowsTest, cls).setUpClass()
+        cls.server = start_server(AutomationStubHandler)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(AutomationShowsTest, cls).tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        del AutomationStubHandler.requests[:]
+
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.settings = override_settings(AUTOMATION_BASE_URL='http://127.0.0.1:%d/shows' % self.server.server_port, AUTOMATION_CACHE_DIR=cache_dir)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def test_loaded_on_first_use(self):
+        field = automation_id_formfield(Schedule._meta.get_field('automation_id'))
+        self.assertEqual(AutomationStubHandler.requests, [])
+
+        choices = [(1, '1 | aardvark'), (3, '00003 | Mixed'), (2, '2 | Zebra')]
+        self.assertEqual(list(field.choices)[1:], choices)
+        self.assertEqual(list(field.choices)[1:], choices)
+        self.assertEqual(AutomationStubHandler.requests, ['/shows'])
+
+    def test_fallback_copy(self):
+        get_automation_id_choices()
+        cache.clear()
+
+        # Nothing listens on the port of a closed server
+        closed = ThreadingHTTPServer(('127.0.0.1', 0), AutomationStubHandler)
+        closed.server_close()
+
+        with override_settings(AUTOMATION_BASE_URL='http://127.0.0.1:%d/shows' % closed.server_port):
+            self.assertEqual(get_automation_id_choices(), [(1, '1 | aardvark'), (3, '00003 | Mixed'), (2, '2 | Zebra')])
+
+        self.assertEqual(AutomationStubHandler.requests, ['/shows'])
+
+
+class SerialExecutor(object):
+    """Runs the jobs of a ProcessPoolExecutor one after another in this process"""
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def map(self, func, *iterables, chunksize=1):
+        return map(func, *iterables)
+
+
+class ThumbnailJobTest(ProgramTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.settings = override_settings(MEDIA_ROOT=media_root)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        os.mkdir(os.path.join(media_root, 'show_images'))
+
+        for name in ('pictured', 'other'):
+            Image.new('RGB', (64, 48)).save(os.path.join(media_root, 'show_images', name + '.png'))
+
+        self.show = self.create_show('Pictured')
+        Show.objects.filter(pk=self.show.pk).update(image='show_images/pictured.png', thumbnails='["show_images/pictured-crop.png"]')
+        self.show.refresh_from_db()
+        ThumbnailJob.objects.all().delete()
+
+    def test_plain_save(self):
+        self.show.name = 'Renamed'
+        self.show.save()
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    def test_changed_image(self):
+        self.show.image = 'show_images/other.png'
+        self.show.save()
+        self.assertEqual(list(ThumbnailJob.objects.values_list('model', 'object_id')), [('program.Show', self.show.pk)])
+
+        ThumbnailJob.objects.all().delete()
+        self.show.image.ppoi = (0.2, 0.8)
+        self.show.save()
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+
+    def test_missing_thumbnails(self):
+        Show.objects.filter(pk=self.show.pk).update(thumbnails='')
+        self.show.refresh_from_db()
+        self.show.save()
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+
+    def test_worker(self):
+        self.show.image = 'show_images/other.png'
+        self.show.save()
+        ThumbnailJob.objects.create(model='program.Show', object_id=0)
+
+        # Forked workers can't see the test transaction, so jobs are rendered in this process
+        with mock.patch.object(thumbnails, 'ProcessPoolExecutor', SerialExecutor), mock.patch.object(thumbnails.connections, 'close_all'):
+            with self.assertLogs('program.thumbnails', 'ERROR'):
+                self.assertEqual(thumbnails.process_jobs(), 2)
+
+        self.show.refresh_from_db()
+        names = thumbnails.get_thumbnails(self.show)
+
+        self.assertEqual(len(names), len(settings.THUMBNAIL_SIZES))
+        self.assertTrue(all(os.path.exists(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+        self.assertFalse(ThumbnailJob.objects.exists())
@@ -0,0 +1,108 @@
+"""
+Thumbnail rendering outside of requests
+
+Saving a host, show or note with a new image or PPOI queues a ThumbnailJob instead of cropping
+its image right away. The process_thumbnail_jobs command renders queued jobs in a pool of
+processes and stores the names of the crops on the objects, which is all serializers read. The
+generate_thumbnails command renders the thumbnails of all images the same way, e.g. to fill in
+existing ones.
+"""
+
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+from program.models import ThumbnailJob
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_MODELS = ('program.Host', 'program.Show', 'program.Note')
+
+
+def get_thumbnails(instance):
+    """Returns the names of the rendered thumbnails of an object, an empty list if there are none (yet)"""
+    return json.loads(instance.thumbnails) if instance.thumbnails else []
+
+
+def render(job):
+    """
+    Crops the image of a (model label, object ID) tuple in all THUMBNAIL_SIZES
+    Runs in worker processes, returns the job and the names of the thumbnails or None on errors
+    """
+
+    label, object_id = job
+
+    try:
+        instance = apps.get_model(label).objects.get(pk=object_id)
+
+        if not instance.image.name:
+            return job, []
+
+        return job, [instance.image.crop[size].name for size in settings.THUMBNAIL_SIZES]
+    except Exception:
+        logger.exception('Could not render thumbnails of %s %s', label, object_id)
+        return job, None
+
+
+def render_all(jobs, workers=None):
+    """
+    Renders the thumbnails of (model label, object ID) tuples in parallel and stores their names
+    Returns the number of objects with rendered thumbnails
+    """
+
+    jobs = list(jobs)
+
+    if not jobs:
+        return 0
+
+    # Forked workers mustn't share the connections of this process
+    connections.close_all()
+
+    with ProcessPoolExecutor(max_workers=workers or getattr(settings, 'THUMBNAIL_WORKERS', None)) as executor:
+        results = list(executor.map(render, jobs, chunksize=8))
+
+    rendered = 0
+
+    for (label, object_id), names in results:
+        if names is not None:
+            apps.get_model(label).objects.filter(pk=object_id).update(thumbnails=json.dumps(names))
+            rendered += 1
+
+    return rendered
+
+
+def process_jobs(limit=100, workers=None):
+    """
+    Renders queued thumbnail jobs and removes them from the queue
+    Returns the number of processed jobs
+    """
+
+    jobs = list(ThumbnailJob.objects.order_by('id')[:limit])
+
+    if not jobs:
+        return 0
+
+    # Objects saved several times are rendered once
+    render_all(set((job.model, job.object_id) for job in jobs), workers)
+
+    # Jobs queued in the meantime are kept for the next run
+    ThumbnailJob.objects.filter(id__in=[job.id for job in jobs]).delete()
+
+    return len(jobs)
+
+
+def get_all_jobs(models=THUMBNAIL_MODELS):
+    """Returns (model label, object ID) tuples of all objects with an image"""
+
+    jobs = []
+
+    for label in models:
+        model = apps.get_model(label)
+        jobs.extend((label, object_id) for object_id in model.objects.exclude(image='').exclude(image=None).values_list('id', flat=True))
+
+    return jobs
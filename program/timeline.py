@@ -0,0 +1,161 @@
+"""
+Process-local timeline for now/next lookups
+
+Keeps the timeslots of today +/- TIMELINE_DAYS days as a sorted list in memory and answers
+which show is on air (and what comes before and after it) by binary search. Gaps between
+timeslots are filled with virtual entries of the default show instead of creating timeslots.
+Overlapping timeslots are interrupted by the later one and continue after it.
+The timeline is rebuilt once the program version changed or the day changed.
+"""
+
+import heapq
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+
+from program.models import Show, TimeSlot
+from program.utils import to_naive
+from program.version import get_program_version
+
+
+# The show filling gaps between timeslots
+DEFAULT_SHOW_ID = 1
+
+
+class TimelineEntry(namedtuple('TimelineEntry', ('start', 'end', 'timeslot_id', 'show_id', 'show_name', 'note_id'))):
+    """A timeslot or a virtual timeslot of the default show if timeslot_id is None"""
+
+    __slots__ = ()
+
+    @property
+    def is_virtual(self):
+        return self.timeslot_id is None
+
+
+class Timeline(object):
+    def __init__(self, entries, start, end, day, version):
+        self.entries = entries
+        self.starts = [entry.start for entry in entries]
+        self.start = start
+        self.end = end
+        self.day = day
+        self.version = version
+
+    @classmethod
+    def build(cls, day, version):
+        """Builds the timeline around the given day with two queries"""
+
+        days = getattr(settings, 'TIMELINE_DAYS', 2)
+        start = datetime.combine(day - timedelta(days=days), time(0, 0))
+        end = datetime.combine(day + timedelta(days=days + 1), time(0, 0))
+
+        timeslots = TimeSlot.objects.get_overlapping_timeslots(start, end).order_by('start').values_list(
+                        'id', 'start', 'end', 'show_id', 'show__name', 'note__id')
+        default_name = Show.objects.filter(pk=DEFAULT_SHOW_ID).values_list('name', flat=True).first()
+
+        timeslots = [TimelineEntry(to_naive(ts_start), to_naive(ts_end), timeslot_id, show_id, show_name, note_id)
+                     for timeslot_id, ts_start, ts_end, show_id, show_name, note_id in timeslots]
+        bounds = sorted(set([start, end] + [dt for ts in timeslots for dt in (ts.start, ts.end) if start < dt < end]))
+
+        entries = []
+        active = []
+        i = 0
+
+        # Between two bounds the latest started timeslot is on air, the ones it overlaps continue after it
+        for left, right in zip(bounds, bounds[1:]):
+            while i < len(timeslots) and timeslots[i].start <= left:
+                heapq.heappush(active, (-i, timeslots[i]))
+                i += 1
+
+            while active and active[0][1].end <= left:
+                heapq.heappop(active)
+
+            if active:
+                entry = active[0][1]._replace(start=left, end=right)
+            else:
+                entry = TimelineEntry(left, right, None, DEFAULT_SHOW_ID, default_name, None)
+
+            if entries and entries[-1]._replace(end=right) == entry._replace(start=entries[-1].start):
+                entries[-1] = entries[-1]._replace(end=right)
+            else:
+                entries.append(entry)
+
+        return cls(entries, start, end, day, version)
+
+    def index(self, dt):
+        """Returns the index of the entry at the given datetime or None if it's outside of the timeline"""
+
+        i = bisect_right(self.starts, dt) - 1
+
+        if i < 0 or self.entries[i].end <= dt:
+            return None
+
+        return i
+
+    def get(self, i):
+        return self.entries[i] if i != None and 0 <= i < len(self.entries) else None
+
+    def current(self, dt=None):
+        """Returns the entry on air at the given datetime, now by default"""
+        return self.get(self.index(dt or datetime.now()))
+
+    def around(self, dt=None):
+        """Returns the previous, current, next and after next entry at the given datetime, now by default"""
+
+        i = self.index(dt or datetime.now())
+
+        if i is None:
+            return None, None, None, None
+
+        return self.get(i - 1), self.get(i), self.get(i + 1), self.get(i + 2)
+
+
+_timeline = None
+_lock = threading.Lock()
+
+
+def get_timeline():
+    """Returns the timeline of this process, rebuilt if the program or the day changed"""
+
+    global _timeline
+
+    version = get_program_version()
+    today = date.today()
+    timeline = _timeline
+
+    if timeline is None or timeline.version != version or timeline.day != today:
+        with _lock:
+            timeline = _timeline
+
+            if timeline is None or timeline.version != version or timeline.day != today:
+                timeline = _timeline = Timeline.build(today, version)
+
+    return timeline
+
+
+def get_timeslots(entries):
+    """
+    Returns timeslot objects for timeline entries, including shows and notes
+    Virtual entries become unsaved timeslots of the default show
+    """
+
+    ids = [entry.timeslot_id for entry in entries if entry and not entry.is_virtual]
+    timeslots = TimeSlot.objects.select_related('show', 'show__type', 'note').in_bulk(ids)
+    default_show = None
+
+    result = []
+
+    for entry in entries:
+        if entry is None:
+            result.append(None)
+        elif not entry.is_virtual:
+            result.append(timeslots.get(entry.timeslot_id))
+        else:
+            if default_show is None:
+                default_show = Show.objects.select_related('type').get(pk=DEFAULT_SHOW_ID)
+            result.append(TimeSlot(start=entry.start, end=entry.end, show=default_show))
+
+    return result
@@ -1,8 +1,8 @@
 from django.conf import settings
 from django.conf.urls import url
-from django.views.decorators.cache import cache_page
 from django.views.static import serve
 from .import views
+from .caching import cache_until_boundary
 
 import os
 
@@ -14,7 +14,7 @@ urlpatterns = [
     url(r'^week/?$', views.WeekScheduleView.as_view()),
     url(r'^(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})/?$', views.DayScheduleView.as_view()),
     url(r'^(?P<year>\d{4})/(?P<week>\d{1,2})/?$', views.WeekScheduleView.as_view()),
-    url(r'^current_box/?$', cache_page(60)(views.CurrentShowBoxView.as_view())),
+    url(r'^current_box/?$', cache_until_boundary()(views.CurrentShowBoxView.as_view())),
     url(r'^hosts/?$', views.HostListView.as_view()),
     url(r'^hosts/(?P<pk>\d+)/?$', views.HostDetailView.as_view(), name='host-detail'),
     url(r'^tips/?$', views.RecommendationsListView.as_view()),
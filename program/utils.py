@@ -1,33 +1,73 @@
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 
 import json
-import urllib
 import bisect
+from urllib.request import urlopen
 from os.path import join
 from datetime import datetime, date, timedelta
 
 
-def get_automation_id_choices():
+AUTOMATION_SHOWS_KEY = 'automation:shows'
+
+
+def fetch_automation_shows():
+    """
+    Requests the shows of the automation and keeps them in the cache until AUTOMATION_REFRESH_INTERVAL passed
+    Falls back to the copy in AUTOMATION_CACHE_DIR if the automation isn't reachable
+    """
+
     base_url = getattr(settings, 'AUTOMATION_BASE_URL', None)
     cache_dir = getattr(settings, 'AUTOMATION_CACHE_DIR', 'cache')
     cached_shows = join(cache_dir, 'shows.json')
-    shows = []
+    shows = None
+
     if base_url:
         try:
-            shows_json = urllib.urlopen(base_url).read()
-            shows_list = json.loads(shows_json)['shows']
-            multi_shows_list = json.loads(shows_json)['multi-shows']
-        except IOError:
+            with urlopen(base_url, timeout=getattr(settings, 'AUTOMATION_TIMEOUT', 10)) as conn:
+                shows_json = conn.read().decode('utf-8')
+            shows = json.loads(shows_json)
+        except (IOError, ValueError):
+            pass
+        else:
             try:
-                with open(cached_shows) as cache:
-                    shows_list = json.loads(cache.read())['shows']
-                    multi_shows_list = json.loads(cache.read())['multi-shows']
+                with open(cached_shows, 'w') as f:
+                    f.write(shows_json)
             except IOError:
-                shows_list = []
-                multi_shows_list = []
-        else:
-            with open(cached_shows, 'w') as cache:
-                cache.write(shows_json)
+                pass
+
+    if shows is None:
+        try:
+            with open(cached_shows) as f:
+                shows = json.loads(f.read())
+        except (IOError, ValueError):
+            shows = {'shows': [], 'multi-shows': []}
+
+    cache.set(AUTOMATION_SHOWS_KEY, shows, getattr(settings, 'AUTOMATION_REFRESH_INTERVAL', 60 * 60))
+    return shows
+
+
+def get_automation_shows():
+    """Returns the shows of the automation, loaded on first use and refreshed after AUTOMATION_REFRESH_INTERVAL"""
+
+    shows = cache.get(AUTOMATION_SHOWS_KEY)
+
+    if shows is None:
+        shows = fetch_automation_shows()
+
+    return shows
+
+
+def get_automation_id_choices():
+    """Returns choices for automation IDs, evaluated whenever a form is instantiated"""
+
+    shows = []
+
+    if getattr(settings, 'AUTOMATION_BASE_URL', None):
+        automation_shows = get_automation_shows()
+        shows_list = automation_shows.get('shows', [])
+        multi_shows_list = automation_shows.get('multi-shows', [])
 
         shows = [(s['id'], '%d | %s' % (s['id'], s['title']), s['title']) for s in shows_list if not s.get('multi')]
 
@@ -41,13 +81,7 @@ def get_automation_id_choices():
 
 
 def get_cached_shows():
-    cache_dir = getattr(settings, 'AUTOMATION_CACHE_DIR', 'cache')
-    cached_shows = join(cache_dir, 'shows.json')
-    shows = {}
-    with open(cached_shows) as shows_json:
-        shows = json.loads(shows_json.read())
-
-    return shows
+    return get_automation_shows()
 
 
 def tofirstdayinisoweek(year, week):
@@ -55,4 +89,11 @@ def tofirstdayinisoweek(year, week):
     ret = datetime.strptime('%04d-%02d-1' % (year, week), '%Y-%W-%w')
     if date(year, 1, 4).isoweekday() > 4:
         ret -= timedelta(days=7)
-    return ret
\ No newline at end of file
+    return ret
+
+
+def to_naive(dt):
+    """Converts a timezone-aware datetime from the database to local time, leaves naive ones as they are"""
+    if dt is not None and timezone.is_aware(dt):
+        return timezone.make_naive(dt)
+    return dt
@@ -0,0 +1,62 @@
+"""
+Global program version
+
+The version is bumped whenever schedules, timeslots, shows or notes change and is used to tag
+precomputed snapshots of the program. It is kept in a single database row, so bumps of any
+process, e.g. management commands or other workers, are seen by all of them while the snapshots
+themselves may stay in a per-process cache.
+"""
+
+import time
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+VERSION_ID = 1
+
+
+def get_program_version():
+    """Returns the current program version"""
+
+    from program.models import ProgramVersion
+
+    version = ProgramVersion.objects.filter(pk=VERSION_ID).values_list('version', flat=True).first()
+
+    if version is None:
+        # Start from the current time in ms so versions never repeat if the row was lost
+        try:
+            with transaction.atomic():
+                version = ProgramVersion.objects.create(pk=VERSION_ID, version=int(time.time() * 1000)).version
+        except IntegrityError:
+            version = ProgramVersion.objects.get(pk=VERSION_ID).version
+
+    return version
+
+
+def bump_program_version():
+    """
+    Increments the program version once the current transaction is committed
+    Otherwise a concurrent request could cache the old program under the new version
+    """
+
+    connection = transaction.get_connection()
+
+    if connection.in_atomic_block:
+        # A bump registered outside of the current savepoints runs in any case
+        savepoint_ids = set(connection.savepoint_ids)
+
+        if any(func == increment_program_version and sids <= savepoint_ids for sids, func in connection.run_on_commit):
+            return
+
+    transaction.on_commit(increment_program_version)
+
+
+def increment_program_version():
+    """Increments the program version right away"""
+
+    from program.models import ProgramVersion
+
+    if not ProgramVersion.objects.filter(pk=VERSION_ID).update(version=F('version') + 1):
+        get_program_version()
+        ProgramVersion.objects.filter(pk=VERSION_ID).update(version=F('version') + 1)
@@ -5,8 +5,9 @@ from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth.models import User
-from django.http import Http404, HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 from django.views.generic.base import TemplateView
 from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
@@ -16,8 +17,12 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.pagination import LimitOffsetPagination
 
-from program.models import Type, MusicFocus, Language, Note, Show, Category, RTRCategory, Topic, TimeSlot, Host, Schedule, RRule
-from program.serializers import TypeSerializer, LanguageSerializer, MusicFocusSerializer, NoteSerializer, ShowSerializer, ScheduleSerializer, CategorySerializer, RTRCategorySerializer, TopicSerializer, TimeSlotSerializer, HostSerializer, UserSerializer
+from program.models import Type, MusicFocus, Language, Note, Show, Category, RTRCategory, Topic, TimeSlot, TimeSlotChange, Host, Schedule, RRule
+from program.pagination import NotePagination, TimeSlotPagination
+from program.serializers import TypeSerializer, LanguageSerializer, MusicFocusSerializer, NoteSerializer, ShowSerializer, ScheduleSerializer, CategorySerializer, RTRCategorySerializer, TopicSerializer, TimeSlotSerializer, HostSerializer, UserSerializer, get_requested_fields
+from program.playout import get_playout_snapshot, get_playout_changes
+from program import timeline
+from program.week import render_week_grid
 from program.utils import tofirstdayinisoweek, get_cached_shows
 
 
@@ -29,7 +34,7 @@ class CalendarView(TemplateView):
 # Deprecated
 class HostListView(ListView):
     context_object_name = 'host_list'
-    queryset = Host.objects.filter(Q(is_active=True) | Q(shows__schedules__until__gt=datetime.now())).distinct()
+    queryset = Host.objects.filter(Q(is_active=True) | Q(active_until__gt=date.today()))
     template_name = 'host_list.html'
 
 
@@ -46,7 +51,7 @@ class ShowListView(ListView):
     template_name = 'show_list.html'
 
     def get_queryset(self):
-        queryset = Show.objects.filter(schedules__until__gt=date.today()).exclude(id=1).distinct()
+        queryset = Show.objects.filter(active_until__gt=date.today()).exclude(id=1)
         if 'type' in self.request.GET:
             type = get_object_or_404(Type, slug=self.request.GET['type'])
             queryset = queryset.filter(type=type)
@@ -117,24 +122,32 @@ class DayScheduleView(TemplateView):
         context = super(DayScheduleView, self).get_context_data(**kwargs)
         context['day'] = today
         context['recommendations'] = Note.objects.filter(status=1, timeslot__start__range=(today, tomorrow))
-        context['default_show'] = Show.objects.get(pk=1)
+        default_show = Show.objects.select_related('type').prefetch_related('category', 'topic', 'musicfocus').get(pk=1)
+        context['default_show'] = default_show
 
-        timeslots = TimeSlot.objects.get_day_timeslots(today)
+        timeslots = TimeSlot.objects.get_day_timeslots(today).select_related('show', 'show__type', 'note') \
+                                                             .prefetch_related('show__category', 'show__topic', 'show__musicfocus')
+        filtered = None
 
         if 'type' in self.request.GET:
             type = get_object_or_404(Type, slug=self.request.GET['type'])
-            context['timeslots'] = timeslots.filter(show__type=type)
+            filtered = timeslots.filter(show__type=type)
         elif 'musicfocus' in self.request.GET:
             musicfocus = get_object_or_404(MusicFocus, slug=self.request.GET['musicfocus'])
-            context['timeslots'] = timeslots.filter(show__musicfocus=musicfocus)
+            filtered = timeslots.filter(show__musicfocus=musicfocus)
         elif 'category' in self.request.GET:
             category = get_object_or_404(Category, slug=self.request.GET['category'])
-            context['timeslots'] = timeslots.filter(show__category=category)
+            filtered = timeslots.filter(show__category=category)
         elif 'topic' in self.request.GET:
             topic = get_object_or_404(Topic, slug=self.request.GET['topic'])
-            context['topic'] = timeslots.filter(show__topic=topic)
+            filtered = timeslots.filter(show__topic=topic)
+
+        if filtered != None:
+            # Filtered out timeslots would leave gaps which aren't the default show's
+            context['timeslots'] = filtered.order_by('start')
         else:
-            context['timeslots'] = timeslots
+            context['timeslots'] = TimeSlot.objects.fill_gaps(timeslots.order_by('start'), today, tomorrow, default_show)
+
         return context
 
 
@@ -144,10 +157,7 @@ class CurrentShowBoxView(TemplateView):
     template_name = 'boxes/current.html'
 
     def get_context_data(self, **kwargs):
-        current_timeslot = TimeSlot.objects.get_or_create_current()
-        previous_timeslot = current_timeslot.get_previous_by_start()
-        next_timeslot = current_timeslot.get_next_by_start()
-        after_next_timeslot = next_timeslot.get_next_by_start()
+        previous_timeslot, current_timeslot, next_timeslot, after_next_timeslot = timeline.get_timeslots(timeline.get_timeline().around())
 
         context = super(CurrentShowBoxView, self).get_context_data(**kwargs)
         context['current_timeslot'] = current_timeslot
@@ -169,29 +179,9 @@ class WeekScheduleView(TemplateView):
             year, week = datetime.now().strftime('%G__%V').split('__')
 
         monday = tofirstdayinisoweek(int(year), int(week))
-        tuesday = monday + timedelta(days=1)
-        wednesday = monday + timedelta(days=2)
-        thursday = monday + timedelta(days=3)
-        friday = monday + timedelta(days=4)
-        saturday = monday + timedelta(days=5)
-        sunday = monday + timedelta(days=6)
 
         context = super(WeekScheduleView, self).get_context_data()
-        context['monday'] = monday
-        context['tuesday'] = tuesday
-        context['wednesday'] = wednesday
-        context['thursday'] = thursday
-        context['friday'] = friday
-        context['saturday'] = saturday
-        context['sunday'] = sunday
-        context['default_show'] = Show.objects.get(pk=1)
-        context['monday_timeslots'] = TimeSlot.objects.get_day_timeslots(monday)
-        context['tuesday_timeslots'] = TimeSlot.objects.get_day_timeslots(tuesday)
-        context['wednesday_timeslots'] = TimeSlot.objects.get_day_timeslots(wednesday)
-        context['thursday_timeslots'] = TimeSlot.objects.get_day_timeslots(thursday)
-        context['friday_timeslots'] = TimeSlot.objects.get_day_timeslots(friday)
-        context['saturday_timeslots'] = TimeSlot.objects.get_day_timeslots(saturday)
-        context['sunday_timeslots'] = TimeSlot.objects.get_day_timeslots(sunday)
+        context['grid'] = render_week_grid(monday)
         context['last_w'] = datetime.strftime(monday - timedelta(days=7), '%G/%V')
         context['cur_w'] = datetime.strftime(monday, '%G/%V')
         context['next_w1'] = datetime.strftime(monday + timedelta(days=7), '%G/%V')
@@ -251,6 +241,8 @@ def json_playout(request):
        - internal calendar to retrieve all timeslots for a week
          Expects GET variable 'start' (date), otherwise start will be today
          If end not given, it returns all timeslots of the next 7 days
+
+    With GET variable 'fill=default' gaps between timeslots are filled with entries of the default show
     """
 
     if request.GET.get('start') == None:
@@ -260,61 +252,45 @@ def json_playout(request):
 
     if request.GET.get('end') == None:
         # If no end was given, return the next week
-        timeslots = TimeSlot.objects.get_7d_timeslots(start).select_related('schedule').select_related('show')
+        end = None
     else:
         # Otherwise return the given timerange
         end = datetime.combine( datetime.strptime(request.GET.get('end'), '%Y-%m-%d').date(), time(23, 59))
-        timeslots = TimeSlot.objects.get_timerange_timeslots(start, end).select_related('schedule').select_related('show')
 
-    schedule = []
-    for ts in timeslots:
+    # Unchanged timeranges are answered from the snapshot store without touching the database
+    etag, content = get_playout_snapshot(start, end, request.GET.get('fill') == 'default')
 
-        is_repetition = ' ' + _('REP') if ts.schedule.is_repetition is 1 else ''
-
-        hosts = ', '.join(ts.show.hosts.values_list('name', flat=True))
-        categories = ', '.join(ts.show.category.values_list('category', flat=True))
-        topics = ', '.join(ts.show.topic.values_list('topic', flat=True))
-        musicfocus = ', '.join(ts.show.musicfocus.values_list('focus', flat=True))
-        languages = ', '.join(ts.show.language.values_list('name', flat=True))
-        rtrcategory = RTRCategory.objects.get(pk=ts.show.rtrcategory_id)
-        type = Type.objects.get(pk=ts.show.type_id)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type="application/json; charset=utf-8")
 
-        classname = 'default'
+    response['ETag'] = etag
+    return response
 
-        if ts.playlist_id is None or ts.playlist_id == 0:
-            classname = 'danger'
 
-        entry = {
-            'id': ts.id,
-            'start': ts.start.strftime('%Y-%m-%dT%H:%M:%S'),
-            'end': ts.end.strftime('%Y-%m-%dT%H:%M:%S'),
-            'title': ts.show.name + is_repetition, # For JS Calendar
-            'automation-id': -1,
-            'schedule_id': ts.schedule.id,
-            'is_repetition': ts.is_repetition,
-            'playlist_id': ts.playlist_id,
-            'schedule_fallback_id': ts.schedule.fallback_id, # The schedule's fallback
-            'show_fallback_id': ts.show.fallback_id, # The show's fallback
-            'show_id': ts.show.id,
-            'show_name': ts.show.name + is_repetition,
-            'show_hosts': hosts,
-            'show_type': type.type,
-            'show_categories': categories,
-            'show_topics': topics,
-            'show_musicfocus': musicfocus,
-            'show_languages': languages,
-            'show_rtrcategory': rtrcategory.rtrcategory,
-            'station_fallback_id': 0, # TODO: The station's global fallback (might change)
-            'memo': ts.memo,
-            'className': classname,
-        }
+def json_playout_changes(request):
+    """
+    Called by engine (playout) to retrieve timeslots changed since the last sync
+    Expects GET variable 'since' (version), 0 returns all changes ever logged
+
+    Returns the version to sync from next time, upserted timeslots in the same format as json_playout
+    and IDs of deleted timeslots. Changes of the last PLAYOUT_CHANGES_SETTLE seconds are sent again
+    next time, since they may have been committed out of order. Changes are kept for
+    PLAYOUT_CHANGES_RETENTION_DAYS days (see the prune_timeslot_changes command). Older versions
+    are answered with 410 and the version to continue from after syncing all timeslots again.
+    """
 
-        if ts.schedule.automation_id:
-            entry['automation-id'] = ts.schedule.automation_id
+    try:
+        since = int(request.GET.get('since'))
+    except (TypeError, ValueError):
+        return JsonResponse({'detail': _("GET variable 'since' must be a version number.")}, status=400)
 
-        schedule.append(entry)
+    if since < TimeSlotChange.objects.get_first_version():
+        return JsonResponse({'detail': _("Changes since this version were pruned, sync all timeslots again."),
+                             'version': TimeSlotChange.objects.get_settled_version()}, status=410)
 
-    return HttpResponse(json.dumps(schedule, ensure_ascii=False).encode('utf8'),
+    return HttpResponse(json.dumps(get_playout_changes(since), ensure_ascii=False).encode('utf8'),
                         content_type="application/json; charset=utf-8")
 
 
@@ -375,7 +351,7 @@ class APIUserViewSet(viewsets.ModelViewSet):
 
     def list(self, request):
         users = self.get_queryset()
-        serializer = UserSerializer(users, many=True)
+        serializer = self.get_serializer(users, many=True)
         return Response(serializer.data)
 
 
@@ -387,7 +363,7 @@ class APIUserViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
         user = get_object_or_404(User, pk=pk)
-        serializer = UserSerializer(user)
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
 
@@ -467,15 +443,12 @@ class APIShowViewSet(viewsets.ModelViewSet):
         if self.request.GET.get('active') == 'true':
             '''Filter currently running shows'''
 
-            # Get currently running schedules to filter by first
-            # For single dates we test if there'll be one in the future (and ignore the until date)
-            # TODO: Really consider dstart? (=currently active, not just upcoming ones)
-            # Add limit for future?
-            schedules = Schedule.objects.filter( Q(rrule_id__gt=1,dstart__lte=date.today(),until__gte=date.today()) |
-                                                 Q(rrule_id=1,dstart__gte=date.today())
-                                               ).distinct().values_list('show_id', flat=True)
+            # Shows with a schedule running today, or a single timeslot today or later
+            # Unlike active_until, schedules which haven't started yet don't count
+            schedules = Schedule.objects.filter(Q(rrule_id__gt=1, dstart__lte=date.today(), until__gte=date.today()) |
+                                                Q(rrule_id=1, dstart__gte=date.today()))
 
-            shows = Show.objects.filter(id__in=schedules)
+            shows = Show.objects.filter(id__in=schedules.values('show_id'))
 
         if self.request.GET.get('owner') != None:
             '''Filter shows by owner'''
@@ -485,7 +458,10 @@ class APIShowViewSet(viewsets.ModelViewSet):
             '''Filter shows by host'''
             shows = shows.filter(hosts__in=[int(self.request.GET.get('host'))])
 
-        return shows
+        # Fetch each M2M relation to serialize with one query for all shows
+        prefetched = get_requested_fields(self.request, ShowSerializer.prefetched_fields)
+
+        return shows.prefetch_related(*prefetched)
 
 
     def create(self, request, pk=None):
@@ -509,7 +485,7 @@ class APIShowViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, pk=None):
         """Returns a single show"""
         show = get_object_or_404(Show, pk=pk)
-        serializer = ShowSerializer(show)
+        serializer = self.get_serializer(show)
 
         return Response(serializer.data)
 
@@ -580,7 +556,7 @@ class APIScheduleViewSet(viewsets.ModelViewSet):
     def list(self, request, show_pk=None, pk=None):
         """List Schedules of a show"""
         schedules = self.get_queryset()
-        serializer = ScheduleSerializer(schedules, many=True)
+        serializer = self.get_serializer(schedules, many=True)
         return Response(serializer.data)
 
 
@@ -591,7 +567,7 @@ class APIScheduleViewSet(viewsets.ModelViewSet):
         else:
             schedule = get_object_or_404(Schedule, pk=pk)
 
-        serializer = ScheduleSerializer(schedule)
+        serializer = self.get_serializer(schedule)
         return Response(serializer.data)
 
 
@@ -687,11 +663,13 @@ class APITimeSlotViewSet(viewsets.ModelViewSet):
     /api/v1/shows/1/schedules/1/timeslots                                 Returns all timeslots of the schedule (GET, POST)
     /api/v1/shows/1/schedules/1/timeslots/1                               Returns a timeslot by its ID (GET, PUT, DELETE)
     /api/v1/shows/1/schedules/1/timeslots?start=2017-01-01&end=2017-02-01 Returns all timeslots of the schedule within the given timerange
+    /api/v1/timeslots/?limit=100                                          Returns the first page of timeslots ordered by start, continued by the cursor of the next link
+    /api/v1/timeslots/?limit=100&count=approximate                        Returns the page including an estimate of the total number of timeslots
     """
 
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
     serializer_class = TimeSlotSerializer
-    pagination_class = LimitOffsetPagination
+    pagination_class = TimeSlotPagination
     queryset = TimeSlot.objects.none()
     required_scopes = ['timeslots']
 
@@ -745,7 +723,7 @@ class APITimeSlotViewSet(viewsets.ModelViewSet):
         else:
             timeslot = get_object_or_404(TimeSlot, pk=pk)
 
-        serializer = TimeSlotSerializer(timeslot)
+        serializer = self.get_serializer(timeslot)
         return Response(serializer.data)
 
 
@@ -808,6 +786,8 @@ class APINoteViewSet(viewsets.ModelViewSet):
     /api/v1/shows/1/timeslots/1/note/1              Returns a note by its ID (GET) - PUT/DELETE not allowed at this level
     /api/v1/shows/1/schedules/1/timeslots/1/note    Returns a note to the timeslot (GET, POST) - Only one note allowed per timeslot
     /api/v1/shows/1/schedules/1/timeslots/1/note/1  Returns a note by its ID (GET, PUT, DELETE)
+    /api/v1/notes/?limit=100                        Returns the first page of notes ordered by start, continued by the cursor of the next link
+    /api/v1/notes/?limit=100&order=created          Returns the first page of notes ordered by their creation (GET)
 
     Superusers may access and update all notes
     """
@@ -815,7 +795,7 @@ class APINoteViewSet(viewsets.ModelViewSet):
     queryset = Note.objects.none()
     serializer_class = NoteSerializer
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
-    pagination_class = LimitOffsetPagination
+    pagination_class = NotePagination
     required_scopes = ['notes']
 
 
@@ -935,7 +915,7 @@ class APINoteViewSet(viewsets.ModelViewSet):
         else:
             note = get_object_or_404(Note, pk=pk)
 
-        serializer = NoteSerializer(note)
+        serializer = self.get_serializer(note)
         return Response(serializer.data)
 
 
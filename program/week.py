@@ -0,0 +1,74 @@
+"""
+Week grid of the program
+
+Fetches the timeslots of a week from Monday 06:00 to the next Monday 06:00 with one query,
+buckets them into broadcast days (06:00 - 06:00) and fills the gaps with the default show.
+The rendered grid is cached per ISO week and language until the program version changes.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from program.models import Show, TimeSlot
+from program.utils import to_naive
+from program.version import get_program_version
+
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# Broadcast days start at 06:00
+DAY_START = time(6, 0)
+
+
+def get_week_grid(monday):
+    """
+    Returns a list of dicts with the ID, date and timeslots of each broadcast day of the week
+    Takes two queries: one for the timeslots and one for the default show
+    """
+
+    first = datetime.combine(monday, DAY_START)
+    last = first + timedelta(days=7)
+    day = timedelta(days=1)
+
+    timeslots = TimeSlot.objects.get_overlapping_timeslots(first, last).select_related('show', 'show__type').order_by('start')
+    default_show = Show.objects.select_related('type').get(pk=1)
+
+    buckets = [[] for weekday in WEEKDAYS]
+
+    # Timeslots over 06:00 show up on both days
+    for timeslot in timeslots:
+        start, end = to_naive(timeslot.start), to_naive(timeslot.end)
+
+        for i in range(max(0, (start - first) // day), min(len(WEEKDAYS) - 1, (end - first - timedelta(microseconds=1)) // day) + 1):
+            buckets[i].append(timeslot)
+
+    grid = []
+
+    for i, weekday in enumerate(WEEKDAYS):
+        start = first + i * day
+        grid.append({
+            'id': weekday,
+            'date': start.date(),
+            'timeslots': TimeSlot.objects.fill_gaps(buckets[i], start, start + day, default_show),
+        })
+
+    return grid
+
+
+def render_week_grid(monday):
+    """Returns the rendered grid of the week starting on the given monday, from the cache if the program didn't change"""
+
+    year, week = monday.strftime('%G__%V').split('__')
+    key = 'week:%s:%s:%s:%s' % (get_program_version(), get_language(), year, week)
+    content = cache.get(key)
+
+    if content is None:
+        content = render_to_string('week_schedule_grid.html', {'days': get_week_grid(monday)})
+        cache.set(key, content, getattr(settings, 'WEEK_CACHE_TIMEOUT', 60 * 60 * 24))
+
+    return mark_safe(content)
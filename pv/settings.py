@@ -115,6 +115,11 @@ INSTALLED_APPS = (
 
 THUMBNAIL_SIZES = ['640x480', '200x200', '150x150']
 
+# Thumbnails are rendered by the process_thumbnail_jobs command
+# Number of worker processes (None for the number of cores) and seconds to wait for new jobs
+THUMBNAIL_WORKERS = None
+THUMBNAIL_JOB_INTERVAL = 5
+
 #TINYMCE_JS_URL = '/static/js/tiny_mce/tiny_mce.js'
 TINYMCE_DEFAULT_CONFIG = {
     #'plugins': 'contextmenu',
@@ -129,7 +134,41 @@ TINYMCE_DEFAULT_CONFIG = {
     'height': 400,
 }
 
-CACHE_BACKEND = 'locmem://'
+# The program version tagging cached snapshots is kept in the database, so changes made by other
+# processes are seen even with a per-process cache. A shared one (e.g. memcached) avoids
+# computing the same snapshots in each process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds a serialized playout timerange is kept in the cache
+# Snapshots are invalidated as soon as the program changes anyway
+PLAYOUT_SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+# Changes logged within the last x seconds are sent again by /api/v1/playout/changes,
+# since transactions may commit them out of order
+PLAYOUT_CHANGES_SETTLE = 60
+
+# Days timeslot changes are kept for incremental syncs, see the prune_timeslot_changes command
+PLAYOUT_CHANGES_RETENTION_DAYS = 30
+
+# Seconds projected timeslots and collisions are kept between submitting and resolving a schedule
+CONFLICT_SESSION_TIMEOUT = 60 * 30
+
+# Seconds the FRAPP output of a day is kept in the cache, invalidated as soon as the program changes
+FRAPP_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Seconds the rendered week grid is kept in the cache, invalidated as soon as the program changes
+WEEK_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Days before and after today kept in the in-memory timeline answering which show is on air
+TIMELINE_DAYS = 2
+
+# Views showing what is on air are cached until the next timeslot boundary, but at most x seconds
+# since clients keep them until then even if the program changes
+BOUNDARY_CACHE_TIMEOUT = 60 * 60
 
 # When generating schedules/timeslots:
 # If until date wasn't set, add x days to start time
@@ -144,6 +183,22 @@ MUSIKPROG_IDS = (
 )
 SPECIAL_PROGRAM_IDS = ()
 
+# The current title of the nop service is answered from memory, keeping the last x pool entries
+# of master and standby, and refreshed from the automation's database at most every x seconds
+NOP_BUFFER_SIZE = 50
+NOP_REFRESH_INTERVAL = 5
+
+# Maximum number of days the plays of /nop/range may be requested for at once
+NOP_RANGE_MAX_DAYS = 7
+
+# Seconds without changes after which /nop/events sends a comment to keep the connection open
+NOP_EVENTS_KEEPALIVE = 15
+
+# Shows of the automation (AUTOMATION_BASE_URL) are loaded on first use, not at startup
+# Seconds until they are requested again, see the refresh_automation_shows command
+AUTOMATION_REFRESH_INTERVAL = 60 * 60
+AUTOMATION_TIMEOUT = 10
+
 # URL to CBA - Cultural Broadcasting Archive
 CBA_URL = 'https://cba.fro.at'
 
@@ -157,6 +212,17 @@ CBA_AJAX_URL = CBA_URL + '/wp-admin/admin-ajax.php'
 # URL to CBA's REST API with trailing slash
 CBA_REST_API_URL = CBA_URL + '/wp-json/wp/v2/'
 
+# Seconds until cached audio URLs of CBA posts are fetched again, failed lookups are retried earlier
+CBA_AUDIO_URL_TTL = 60 * 60 * 24
+CBA_AUDIO_URL_FAILED_TTL = 60 * 15
+
+# Seconds to wait for CBA and number of concurrent requests
+CBA_TIMEOUT = 10
+CBA_WORKERS = 4
+
+# Whether audio URLs of saved notes are fetched in a background thread
+CBA_RESOLVE_IN_BACKGROUND = True
+
 
 try:
     from .local_settings import *
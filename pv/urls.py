@@ -6,7 +6,7 @@ from rest_framework_nested import routers
 from rest_framework.authtoken import views
 from oidc_provider import urls
 
-from program.views import APIUserViewSet, APIHostViewSet, APIShowViewSet, APIScheduleViewSet, APITimeSlotViewSet, APINoteViewSet, APICategoryViewSet, APITypeViewSet, APITopicViewSet, APIMusicFocusViewSet, APIRTRCategoryViewSet, APILanguageViewSet, json_day_schedule, json_playout, json_timeslots_specials
+from program.views import APIUserViewSet, APIHostViewSet, APIShowViewSet, APIScheduleViewSet, APITimeSlotViewSet, APINoteViewSet, APICategoryViewSet, APITypeViewSet, APITopicViewSet, APIMusicFocusViewSet, APIRTRCategoryViewSet, APILanguageViewSet, json_day_schedule, json_playout, json_playout_changes, json_timeslots_specials
 
 admin.autodiscover()
 
@@ -60,6 +60,7 @@ urlpatterns = [
     url(r'^api/v1/', include(show_timeslot_router.urls)),
     url(r'^api/v1/', include(schedule_router.urls)),
     url(r'^api/v1/', include(timeslot_router.urls)),
+    url(r'^api/v1/playout/changes/?$', json_playout_changes),
     url(r'^api/v1/playout', json_playout),
     url(r'^api/v1/program/week', json_playout),
     url(r'^api/v1/program/(?P<year>\d{4})/(?P<month>\d{1,2})/(?P<day>\d{1,2})/$', json_day_schedule),